@@ -6,5 +6,75 @@ DEFAULT_PYD_GENERATORS = {
     "llm_stepbystep": "strict_actions"
 }
 DEFAULT_PLAN_MATCHER = "greedy_action"
+# search used by the LLM+Planner methods, see symbolic_planners.py, and its budgets (None for no limit)
+DEFAULT_SYMBOLIC_PLANNER = "forward"
+SYMBOLIC_PLANNER_MAX_NODES = None
+SYMBOLIC_PLANNER_MAX_TIME_SEC = None
+# configurations run in parallel when the symbolic planner is "portfolio", the first solution wins
+SYMBOLIC_PLANNER_PORTFOLIO = ["forward", "gbfs_ff", "wastar_hadd", "astar_hmax"]
+# limits of the worker process running the symbolic planner (None for no limit)
+PLANNING_TIMEOUT_SEC = 600
+PLANNING_MAX_MEMORY_MB = 8192
+# worker processes solving the problems of different tasks in parallel, each one loads its own Julia
+PLANNING_WORKERS = 2
 OPENAI_MODEL = "gpt-4o-2024-08-06"
-# OPENAI_MODEL = "gpt-4o-mini-2024-07-18"
\ No newline at end of file
+# OPENAI_MODEL = "gpt-4o-mini-2024-07-18"
+
+# "openai" queries the OpenAI API (or a compatible server at OPENAI_BASE_URL),
+# "local" answers offline from fixtures and the ground truth of the tasks
+LLM_BACKEND = "openai"
+OPENAI_BASE_URL = None
+LOCAL_LLM_FIXTURES = None
+LOCAL_LLM_LATENCY_SEC = 0.0
+LOCAL_LLM_LATENCY_JITTER_SEC = 0.0
+
+# maximum number of concurrent requests to the LLM API, the rate limiter adapts
+# the actual concurrency below this value
+LLM_MAX_CONCURRENCY = 8
+# initial quota of the rate limiter, it is updated from the rate limit headers of the API responses
+LLM_REQUESTS_PER_MINUTE = 500
+LLM_TOKENS_PER_MINUTE = 30000
+LLM_ESTIMATED_COMPLETION_TOKENS = 500
+LLM_MAX_RETRIES = 10
+# temperature used when several plans are sampled from the same prompt
+LLM_SAMPLING_TEMPERATURE = 1.0
+
+# USD per million tokens: (input, cached input, output), used to estimate the cost of each call
+LLM_PRICING = {
+    "gpt-4o-2024-08-06": (2.50, 1.25, 10.00),
+    "gpt-4o-mini-2024-07-18": (0.15, 0.075, 0.60)
+}
+
+LLM_CACHE_PATH = "./cache/llm_responses.sqlite"
+LLM_CACHE_MODE = "read_through"
+LLM_CACHE_MAX_SIZE_MB = 1024
+LLM_CACHE_MAX_AGE_DAYS = 90
+
+# sentence embeddings used by the plan matchers, cached in memory and optionally on disk (None to disable)
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# "torch" (sentence-transformers), "torch_int8", "onnx" or "onnx_int8", see embedding_backends.py
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_DIR = "./cache/onnx"
+EMBEDDING_CACHE_MAX_ENTRIES = 100000
+EMBEDDING_CACHE_PATH = "./cache/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_SIZE_MB = 512
+# problems with more ground actions are matched without the precomputed action embedding index
+GROUND_ACTION_INDEX_MAX_SIZE = 50000
+
+# results of the symbolic planner, keyed by the canonical form of the domain and problem
+PLAN_CACHE_PATH = "./cache/plans.sqlite"
+PLAN_CACHE_ENABLED = True
+PLAN_CACHE_MAX_SIZE_MB = 256
+PLAN_CACHE_MAX_AGE_DAYS = 90
+
+# custom Julia system image built by tools/build_sysimage.py, used automatically when present
+JULIA_SYSIMAGE_PATH = "./cache/julia/sysimage.so"
+
+# maximum number of parsed domains, problems and initial states kept in memory by pddl_registry
+PDDL_REGISTRY_MAX_ENTRIES = 256
+# plan and simulate with domains compiled by PDDL.jl instead of the interpreted semantics
+PDDL_COMPILED = False
+# check the safety constraints with clauses grounded once per problem instead of interpreting the formula
+GROUNDED_CONSTRAINTS = True
+# stop simulating a plan at its first unsafe state, leaving its validity and success undetermined
+EVALUATION_EARLY_EXIT = False
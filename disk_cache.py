@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+import time
+
+class DiskCache:
+    """Key-value store backed by a SQLite file, with size and age based eviction."""
+
+    # number of writes between two eviction passes
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path: str, max_size_mb: float = None, max_age_days: float = None):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_age_sec = max_age_days * 24 * 3600 if max_age_days else None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+
+    def _connect(self):
+        # the connection is opened lazily so that importing a module that owns
+        # a cache does not touch the filesystem
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at)")
+            self._evict()
+        return self._conn
+
+    def get(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            now = time.time()
+            if self.max_age_sec is not None and now - created_at > self.max_age_sec:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= self.EVICTION_INTERVAL:
+                self._evict()
+
+    def __contains__(self, key: str):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries")
+
+    def _evict(self):
+        # caller must hold the lock
+        conn = self._conn
+        self._writes_since_eviction = 0
+        if self.max_age_sec is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age_sec,))
+        if self.max_size_bytes is not None:
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                # drop least recently used entries until we are back under the limit
+                excess = total_size - self.max_size_bytes
+                freed = 0
+                stale_keys = []
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+                    stale_keys.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                conn.executemany("DELETE FROM entries WHERE key = ?", stale_keys)
@@ -1,5 +1,9 @@
-import glob
+import hashlib
 import os
+import threading
+
+from collections.abc import Mapping
+from types import MappingProxyType
 from utils import postprocess
 
 ###############################################################################
@@ -31,6 +35,27 @@ class Context(Task):
     def get_ground_truth_pddl_components_f(self):
         return f"{self.name}.init.pddl", f"{self.name}.goal.pddl", f"{self.name}.constraints.pddl"
 
+class DomainCorpus:
+    """In-memory snapshot of the files of a domain directory, read in a single scan."""
+
+    def __init__(self, domain_dir: str):
+        files = {}
+        for fn in sorted(os.listdir(domain_dir)):
+            path = os.path.join(domain_dir, fn)
+            if os.path.isfile(path):
+                with open(path, 'r') as f:
+                    files[fn] = f.read()
+        self.files = MappingProxyType(files)
+        self.hashes = MappingProxyType({fn: hashlib.sha256(content.encode("utf-8")).hexdigest() for fn, content in files.items()})
+
+    def __contains__(self, filename):
+        return filename in self.files
+
+    def read(self, filename) -> str:
+        if filename not in self.files:
+            raise FileNotFoundError(f"{filename} not found in the domain corpus")
+        return self.files[filename]
+
 class Domain:
     def __init__(self):
         # every domain should contain the context as in "in-context learning" (ICL)
@@ -42,28 +67,51 @@ class Domain:
         # - p_example.pddl (the ground-truth problem pddl for the problem)
         # - p_example.sol  (the ground-truth solution in natural language to the problem)
         self.context = Context("p_example")
-        self.tasks: list[Task] = []
         self.domain_dir = f"./domains/{self.name}/"
 
-        self.grab_tasks()
-
-    def grab_tasks(self):
-        path = f"./domains/{self.name}"
+        # the domain files are only read when the domain is first used
+        self._corpus = None
+        self._tasks = None
+        self._context_res = None
+        self._lock = threading.Lock()
+
+    @property
+    def corpus(self) -> DomainCorpus:
+        with self._lock:
+            if self._corpus is None:
+                self._corpus = DomainCorpus(self.domain_dir)
+            return self._corpus
+
+    @property
+    def tasks(self) -> list[Task]:
+        if self._tasks is None:
+            self._tasks = self.grab_tasks()
+        return self._tasks
+
+    def grab_tasks(self) -> list[Task]:
+        corpus = self.corpus
         problem_name_list = []
-        for fn in glob.glob(f"{path}/*.init.nl"):
-            file_base_name = os.path.basename(fn)
-            problem_name = file_base_name.rpartition('.init.nl')[0]
+        for fn in corpus.files:
+            if not fn.endswith(".init.nl"):
+                continue
+            problem_name = fn.rpartition('.init.nl')[0]
             if "domain" not in problem_name and "p_example" not in problem_name:
-                if not os.path.exists(fn.replace(".init.nl", ".goal.nl")):
+                if f"{problem_name}.goal.nl" not in corpus:
                     raise RuntimeError(f"Goal file not present for problem {problem_name} of domain {self.name}")
-                elif not os.path.exists(fn.replace(".init.nl", ".constraints.nl")):
+                elif f"{problem_name}.constraints.nl" not in corpus:
                     raise RuntimeError(f"Constraints file not present for problem {problem_name} of domain {self.name}")
-                elif not os.path.exists(fn.replace(".init.nl", ".pddl")):
+                elif f"{problem_name}.pddl" not in corpus:
                     raise RuntimeError(f"Ground truth PDDL file not present for problem {problem_name} of domain {self.name}")
                 else:
                     problem_name_list.append(problem_name)
         problem_name_list = sorted(problem_name_list)
-        self.tasks = [Task(p_name) for p_name in problem_name_list]
+        return [Task(p_name) for p_name in problem_name_list]
+
+    def _read(self, filename) -> str:
+        return postprocess(self.corpus.read(filename))
+
+    def get_content_hash(self, filename) -> str:
+        return self.corpus.hashes[filename]
 
     def __len__(self):
         return len(self.tasks)
@@ -78,32 +126,19 @@ class Domain:
         return f"{self.name}/{pddl}"
 
     def get_task_init_nl(self, i):
-        init_nl_f = self.tasks[i-1].get_init_filename()
-        with open(os.path.join(self.domain_dir, init_nl_f), 'r') as f:
-            init_nl = f.read()
-        
-        return postprocess(init_nl)
+        return self._read(self.tasks[i-1].get_init_filename())
 
     def get_task_goal_nl(self, i):
-        goal_nl_f = self.tasks[i-1].get_goal_filename()
-        with open(os.path.join(self.domain_dir, goal_nl_f), 'r') as f:
-            goal_nl = f.read()
-        
-        return postprocess(goal_nl)
+        return self._read(self.tasks[i-1].get_goal_filename())
 
     def get_task_constraints_nl(self, i):
-        constraints_nl_f = self.tasks[i-1].get_constraints_filename()
-        with open(os.path.join(self.domain_dir, constraints_nl_f), 'r') as f:
-            constraints_nl = f.read()
-        
-        return postprocess(constraints_nl)
+        return self._read(self.tasks[i-1].get_constraints_filename())
 
     def get_task_pddl(self, i):
-        pddl_f = self.tasks[i-1].get_ground_truth_pddl_filename()
-        with open(os.path.join(self.domain_dir, pddl_f), 'r') as f:
-            pddl = f.read()
-        
-        return postprocess(pddl)
+        return self._read(self.tasks[i-1].get_ground_truth_pddl_filename())
+
+    def get_task_pddl_hash(self, i) -> str:
+        return self.get_content_hash(self.tasks[i-1].get_ground_truth_pddl_filename())
 
     def get_task(self, i):
         init_nl = self.get_task_init_nl(i)
@@ -115,61 +150,58 @@ class Domain:
         return nl, pddl
 
     def get_context(self):
-        init_nl_f = self.context.get_init_filename()
-        goal_nl_f = self.context.get_goal_filename()
-        constraints_nl_f = self.context.get_constraints_filename()
-        pddl_f = self.context.get_ground_truth_pddl_filename()
-        init_pddl_f, goal_pddl_f, constraints_pddl_f = self.context.get_ground_truth_pddl_components_f()
-        sol_f = self.context.get_ground_truth_plan_nl_file()
-
-        with open(os.path.join(self.domain_dir, init_nl_f), 'r') as f:
-            init_nl = f.read()
-        with open(os.path.join(self.domain_dir, goal_nl_f), 'r') as f:
-            goal_nl = f.read()
-        with open(os.path.join(self.domain_dir, constraints_nl_f), 'r') as f:
-            constraints_nl = f.read()
-        with open(os.path.join(self.domain_dir, init_pddl_f), 'r') as f:
-            init_pddl = f.read()
-        with open(os.path.join(self.domain_dir, goal_pddl_f), 'r') as f:
-            goal_pddl = f.read()
-        with open(os.path.join(self.domain_dir, constraints_pddl_f), 'r') as f:
-            constraints_pddl = f.read()
-        with open(os.path.join(self.domain_dir, sol_f), 'r') as f:
-            sol = f.read()
-        res = {
-            "init_nl": postprocess(init_nl),
-            "goal_nl": postprocess(goal_nl),
-            "constraints_nl": postprocess(constraints_nl),
-            "init_pddl": postprocess(init_pddl),
-            "goal_pddl": postprocess(goal_pddl),
-            "constraints_pddl": postprocess(constraints_pddl),
-            "sol": postprocess(sol)
-        }
-        return res
+        if self._context_res is None:
+            init_pddl_f, goal_pddl_f, constraints_pddl_f = self.context.get_ground_truth_pddl_components_f()
+            res = {
+                "init_nl": self._read(self.context.get_init_filename()),
+                "goal_nl": self._read(self.context.get_goal_filename()),
+                "constraints_nl": self._read(self.context.get_constraints_filename()),
+                "init_pddl": self._read(init_pddl_f),
+                "goal_pddl": self._read(goal_pddl_f),
+                "constraints_pddl": self._read(constraints_pddl_f),
+                "sol": self._read(self.context.get_ground_truth_plan_nl_file())
+            }
+            # shared by every planner, hence read-only
+            self._context_res = MappingProxyType(res)
+        return self._context_res
 
     def get_domain_pddl(self):
-        domain_pddl_f = self.get_domain_pddl_file()
-        with open(domain_pddl_f, 'r') as f:
-            domain_pddl = f.read()
-        return postprocess(domain_pddl)
+        return self._read("domain.pddl")
+
+    def get_domain_pddl_hash(self) -> str:
+        return self.get_content_hash("domain.pddl")
 
     def get_domain_pddl_file(self):
         domain_pddl_f = f"{self.domain_dir}/domain.pddl"
         return domain_pddl_f
 
     def get_domain_nl(self):
-        domain_nl_f = self.get_domain_nl_file()
-        try:
-            with open(domain_nl_f, 'r') as f:
-                domain_nl = f.read()
-        except:
-            domain_nl = "Nothing"
-        return postprocess(domain_nl)
+        if "domain.nl" in self.corpus:
+            return self._read("domain.nl")
+        return "Nothing"
 
     def get_domain_nl_file(self):
         domain_nl_f = f"{self.domain_dir}/domain.nl"
         return domain_nl_f
 
+class DomainRegistry(Mapping):
+    """Maps domain names to domain instances, creating each domain on first access."""
+
+    def __init__(self, domain_classes: dict):
+        self._domain_classes = domain_classes
+        self._domains = {}
+
+    def __getitem__(self, name) -> Domain:
+        if name not in self._domains:
+            self._domains[name] = self._domain_classes[name]()
+        return self._domains[name]
+
+    def __iter__(self):
+        return iter(self._domain_classes)
+
+    def __len__(self):
+        return len(self._domain_classes)
+
 
 class Barman(Domain):
     name = "barman" # this should match the directory name
@@ -195,13 +227,13 @@ class Blocksworld(Domain):
 class Manipulation(Domain):
     name = "manipulation" # this should match the directory name
 
-available_domains = {
-    # "barman": Barman(),
-    # "blocksworld": Blocksworld(),
-    # "floortile": Floortile(),
-    # "grippers": Grippers(),
-    # "storage": Storage(),
-    # "termes": Termes(),
-    # "tyreworld": Tyreworld(),
-    "manipulation": Manipulation()
-}
\ No newline at end of file
+available_domains = DomainRegistry({
+    # "barman": Barman,
+    # "blocksworld": Blocksworld,
+    # "floortile": Floortile,
+    # "grippers": Grippers,
+    # "storage": Storage,
+    # "termes": Termes,
+    # "tyreworld": Tyreworld,
+    "manipulation": Manipulation
+})
@@ -0,0 +1,136 @@
+import os
+import threading
+
+import numpy as np
+
+from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR
+
+class BaseEmbeddingBackend:
+    # Backends turn texts into sentence embeddings. The model is only loaded on the first
+    # call of `encode`, so runs that never match plans by embedding do not pay for it.
+
+    name = None
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_name(self) -> str:
+        # embeddings of different backends differ slightly, so they are cached separately
+        return f"{self.model_name}:{self.name}"
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+            return self._model
+
+    def _load(self):
+        raise NotImplementedError
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class TorchEmbeddingBackend(BaseEmbeddingBackend):
+    name = "torch"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(self.model_name)
+
+    def encode(self, texts):
+        return np.asarray(self.model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+
+class QuantizedTorchEmbeddingBackend(TorchEmbeddingBackend):
+    # the linear layers are quantized to int8 on the CPU, which dominate the inference time of the model
+    name = "torch_int8"
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(self.model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxEmbeddingBackend(BaseEmbeddingBackend):
+    """Runs the transformer of the sentence embedding model with ONNX Runtime on the CPU.
+
+    The transformer is exported to ONNX the first time, under EMBEDDING_ONNX_DIR, and its
+    token embeddings are mean-pooled, as in all-MiniLM-L6-v2. With `quantized`, the exported
+    model is also quantized to int8 weights. Needs the optional `onnxruntime` package.
+    """
+
+    name = "onnx"
+    quantized = False
+    BATCH_SIZE = 64
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, onnx_dir: str = EMBEDDING_ONNX_DIR):
+        super().__init__(model_name)
+        self.model_dir = os.path.join(onnx_dir, model_name.replace("/", "_"))
+
+    def _load(self):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(f"The {self.name} embedding backend needs onnxruntime, install it with `pip install onnxruntime`")
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(self.model_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            self._export(model_path)
+        if self.quantized:
+            quantized_model_path = os.path.join(self.model_dir, "model.int8.onnx")
+            if not os.path.exists(quantized_model_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(model_path, quantized_model_path, weight_type=QuantType.QInt8)
+            model_path = quantized_model_path
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        return tokenizer, session
+
+    def _export(self, model_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        print(f"[info] Exporting {self.model_name} to {model_path}")
+        os.makedirs(self.model_dir, exist_ok=True)
+        sentence_model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = sentence_model[0].auto_model
+        tokenizer = sentence_model.tokenizer
+        tokenizer.model_max_length = sentence_model.max_seq_length
+        tokenizer.save_pretrained(self.model_dir)
+
+        inputs = tokenizer(["an example sentence"], return_tensors="pt")
+        # positional order of the forward arguments of BERT-like models
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        torch.onnx.export(transformer, tuple(inputs[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+
+    def encode(self, texts):
+        tokenizer, session = self.model
+        session_inputs = {i.name for i in session.get_inputs()}
+        batches = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            inputs = tokenizer(texts[start:start + self.BATCH_SIZE], padding=True, truncation=True, return_tensors="np")
+            feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in session_inputs}
+            token_embeddings = session.run(None, feed)[0]
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            batches.append((token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+        return np.concatenate(batches).astype(np.float32) if batches else np.zeros((0, 0), dtype=np.float32)
+
+class QuantizedOnnxEmbeddingBackend(OnnxEmbeddingBackend):
+    name = "onnx_int8"
+    quantized = True
+
+available_embedding_backends = {
+    "torch": TorchEmbeddingBackend,
+    "torch_int8": QuantizedTorchEmbeddingBackend,
+    "onnx": OnnxEmbeddingBackend,
+    "onnx_int8": QuantizedOnnxEmbeddingBackend
+}
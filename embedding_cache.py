@@ -0,0 +1,71 @@
+import hashlib
+import threading
+
+import numpy as np
+
+from collections import OrderedDict
+from disk_cache import DiskCache
+
+class EmbeddingCache:
+    """Memoized sentence embeddings, bounded in memory with LRU eviction and optionally persisted on disk.
+
+    Embeddings are keyed by the model and backend (see embedding_backends.py) and the text,
+    so each unique string is encoded once across tasks, perturbations and, with a disk path,
+    runs. Misses of a batch are encoded together in a single call of the backend.
+    """
+
+    def __init__(self, backend, max_entries: int, disk_path: str = None,
+                       disk_max_size_mb: float = None, disk_max_age_days: float = None):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.store = DiskCache(disk_path, disk_max_size_mb, disk_max_age_days) if disk_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.backend.cache_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        # caller must hold the lock
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Embeddings of texts, as a matrix with one row per text."""
+        embeddings = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = self._key(text)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    embeddings[i] = self._entries[key]
+                    self.hits += 1
+                    continue
+                value = self.store.get(key) if self.store is not None else None
+                if value is not None:
+                    embeddings[i] = np.frombuffer(value, dtype=np.float32)
+                    self._remember(key, embeddings[i])
+                    self.hits += 1
+                else:
+                    missing.setdefault(text, []).append(i)
+
+        if missing:
+            new_embeddings = np.asarray(self.backend.encode(list(missing)), dtype=np.float32)
+            with self._lock:
+                for (text, indices), embedding in zip(missing.items(), new_embeddings):
+                    key = self._key(text)
+                    self._remember(key, embedding)
+                    if self.store is not None:
+                        self.store.set(key, embedding.tobytes())
+                    for i in indices:
+                        embeddings[i] = embedding
+                    self.misses += 1
+        return np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+    def encode_one(self, text: str) -> np.ndarray:
+        return self.encode([text])[0]
@@ -1,3 +1,5 @@
+import asyncio
+import copy
 import glob
 import json
 import os
@@ -6,7 +8,8 @@ import text_transformations
 
 from domains import Domain
 from planners import available_planners, PlannerResult
-from plan_evaluator import PlanEvaluator, available_plan_matchers
+from plan_evaluator import available_plan_matchers, evaluate_plans, evaluation_results
+from telemetry import llm_call_context
 from typing import Literal
 
 class ExperimentRunner():
@@ -21,6 +24,7 @@ class ExperimentRunner():
         self.planner_name = planner_name
         self.response_model_generator_name = response_model_generator_name
         self.plan_matcher_name = plan_matcher_name
+        self.pct_words_to_swap = pct_words_to_swap
 
         swap_subdir_name = ""
         if pct_words_to_swap is not None:
@@ -37,6 +41,9 @@ class ExperimentRunner():
         os.makedirs(self.evaluation_dir, exist_ok=True)
 
     def run_experiment(self):
+        asyncio.run(self.run_experiment_async())
+
+    async def run_experiment_async(self):
         task = self.args.task
         init_nl = self.domain.get_task_init_nl(task)
         goal_nl = self.domain.get_task_goal_nl(task)
@@ -46,13 +53,19 @@ class ExperimentRunner():
         task_suffix = self.domain.get_task_suffix(task)
 
         if(self.args.command == "robustness-experiment"):
-            for perturbed_task_name, perturbed_task in self._grab_perturbed_tasks(task_name).items():
-                produced_plan: PlannerResult = self.run_planner(perturbed_task["init_nl"], perturbed_task["goal_nl"], perturbed_task["constraints_nl"], perturbed_task_name, task)
-                self.run_evaluator(produced_plan, task, perturbed_task_name)
+            perturbed_tasks = self._grab_perturbed_tasks(task_name)
+            # the LLM queries of all perturbed tasks run concurrently, evaluation stays sequential
+            produced_samples: list[dict] = await asyncio.gather(*[
+                self.sample_planner_async(perturbed_task["init_nl"], perturbed_task["goal_nl"], perturbed_task["constraints_nl"], perturbed_task_name, task, self.args.samples)
+                for perturbed_task_name, perturbed_task in perturbed_tasks.items()
+            ])
+            self.run_evaluators({sample_name: produced_plan
+                                 for samples in produced_samples
+                                 for sample_name, produced_plan in samples.items()}, task)
             self._summarize_results()
         else:
-            planner_result: PlannerResult = self.run_planner(init_nl, goal_nl, constraints_nl, task_name, task)
-            self.run_evaluator(planner_result, task, task_name)
+            samples = await self.sample_planner_async(init_nl, goal_nl, constraints_nl, task_name, task, self.args.samples)
+            self.run_evaluators(samples, task)
 
     def _grab_perturbed_tasks(self, task_name):
         perturbed_tasks = {}
@@ -80,63 +93,92 @@ class ExperimentRunner():
         return perturbed_tasks
 
     def run_planner(self, init_nl, goal_nl, constraints_nl, task_name, task):
+        return asyncio.run(self.run_planner_async(init_nl, goal_nl, constraints_nl, task_name, task))
+
+    async def run_planner_async(self, init_nl, goal_nl, constraints_nl, task_name, task) -> PlannerResult:
+        samples = await self.sample_planner_async(init_nl, goal_nl, constraints_nl, task_name, task, 1)
+        return samples[task_name]
+
+    async def sample_planner_async(self, init_nl, goal_nl, constraints_nl, task_name, task, samples: int = 1) -> dict[str, PlannerResult]:
+        # returns the planner results by name: the task name itself for a single
+        # sample, and the task name with a "_s<j>" suffix for the j-th of several samples
 
         # get domain, task and planner information
         context = self.domain.get_context()
         domain_pddl = self.domain.get_domain_pddl()
         domain_nl = self.domain.get_domain_nl()
-        planner = available_planners[self.planner_name]
+        # planners keep per task state, so concurrent tasks must not share an instance
+        planner = copy.copy(available_planners[self.planner_name])
 
         start_time = time.time()
 
         planner.set_context(context, self.domain.name, task_name)
         planner.set_response_model_generator(self.response_model_generator_name)
-        planner_result = planner.run_planner(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl)
+        planner.set_symbolic_planner(self.args.symbolic_planner, self.args.planner_max_nodes, self.args.planner_max_time)
+        base_task_name = self.domain.get_task_name(task)
+        with llm_call_context(planner=self.planner_name,
+                              domain=self.domain.name,
+                              task=base_task_name,
+                              perturbation=task_name if task_name != base_task_name else None,
+                              pct_words_to_swap=self.pct_words_to_swap):
+            planner_results = await planner.sample_plans_async(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples)
 
         end_time = time.time()
 
-        if (planner_result.plan_json is not None):
-            plan_json_file_name = f"{self.plan_dir}/{task_name}.json"
-            with open(plan_json_file_name, "w") as f:
-                f.write(planner_result.plan_json)
+        if samples == 1:
+            sample_names = [task_name]
+        else:
+            sample_names = [f"{task_name}_s{j+1}" for j in range(len(planner_results))]
+
+        for sample_name, planner_result in zip(sample_names, planner_results):
+            if (planner_result.plan_json is not None):
+                plan_json_file_name = f"{self.plan_dir}/{sample_name}.json"
+                with open(plan_json_file_name, "w") as f:
+                    f.write(planner_result.plan_json)
+
+            if (planner_result.task_pddl is not None):
+                produced_task_pddl_file_name = f"{self.problem_dir}/{sample_name}.pddl"
+                with open(produced_task_pddl_file_name, "w") as f:
+                    f.write(planner_result.task_pddl)
 
-        if (planner_result.task_pddl is not None):
-            produced_task_pddl_file_name = f"{self.problem_dir}/{task_name}.pddl"
-            with open(produced_task_pddl_file_name, "w") as f:
-                f.write(planner_result.task_pddl)
+            if (planner_result.plan_pddl is not None):
+                plan_pddl_file_name = f"{self.plan_dir}/{sample_name}.pddl"
+                with open(plan_pddl_file_name, "w") as f:
+                    f.write(planner_result.plan_pddl)
 
-        if (planner_result.plan_pddl is not None):
-            plan_pddl_file_name = f"{self.plan_dir}/{task_name}.pddl"
-            with open(plan_pddl_file_name, "w") as f:
-                f.write(planner_result.plan_pddl)
+            if (planner_result.planner_stats is not None):
+                planner_stats_file_name = f"{self.plan_dir}/{sample_name}.planner_stats.json"
+                with open(planner_stats_file_name, "w") as f:
+                    json.dump(planner_result.planner_stats, f, indent=4)
 
-        print(f"[info] task {task} takes {end_time - start_time} sec")
-        return planner_result
+        print(f"[info] task {task_name} takes {end_time - start_time} sec")
+        return dict(zip(sample_names, planner_results))
 
     def run_evaluator(self, planner_result: PlannerResult, task, task_name):
+        self.run_evaluators({task_name: planner_result}, task)
+
+    def run_evaluators(self, planner_results: dict[str, PlannerResult], task):
+        # the plans produced for a task (samples, perturbations) are all evaluated in one batch
 
         domain_pddl = self.domain.get_domain_pddl()
         _, ground_truth_task_pddl = self.domain.get_task(task)
 
         plan_matcher = available_plan_matchers[self.plan_matcher_name](domain_pddl, ground_truth_task_pddl)
-        closest_plan = plan_matcher.plan_closest_match(planner_result)
-        closest_plan_pddl_file_name = f"{self.evaluation_dir}/{task_name}.pddl.closest"
-        with open(closest_plan_pddl_file_name, "w") as f:
-            f.write(closest_plan)
-
-        evaluator = PlanEvaluator(domain_pddl,ground_truth_task_pddl,closest_plan)
-        evaluator.try_simulation()
-
-        results = {}
-
-        results["valid"] = evaluator.is_valid()
-        if(results["valid"]):
-            results["successful"] = evaluator.is_successful()
-            results["safe"] = evaluator.is_safe()
-
-        results_file_name = f"{self.evaluation_dir}/{task_name}.results.json"
-        with open(results_file_name, 'w') as json_file:
-            json.dump(results, json_file, indent=4)
+        closest_plans = {}
+        for task_name, planner_result in planner_results.items():
+            closest_plan = plan_matcher.plan_closest_match(planner_result)
+            closest_plan_pddl_file_name = f"{self.evaluation_dir}/{task_name}.pddl.closest"
+            with open(closest_plan_pddl_file_name, "w") as f:
+                f.write(closest_plan)
+            closest_plans[task_name] = closest_plan
+
+        batch = evaluate_plans(domain_pddl, ground_truth_task_pddl, list(closest_plans.values()), self.args.eval_early_exit)
+
+        for i, task_name in enumerate(closest_plans):
+            results = evaluation_results(batch, i)
+            results_file_name = f"{self.evaluation_dir}/{task_name}.results.json"
+            with open(results_file_name, 'w') as json_file:
+                json.dump(results, json_file, indent=4)
 
     def produce_perturbations(self, perturbation_recipe: str, 
                                     pct_words_to_swap: float, 
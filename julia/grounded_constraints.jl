@@ -0,0 +1,162 @@
+# Grounded safety constraints, loaded by pddl_registry.py.
+# The constraint formula of a problem is grounded once into clauses over an index of
+# ground facts. Checking a state then takes one lookup per fact and a few bitmask tests,
+# instead of interpreting the formula generically on every state.
+module GroundedConstraints
+
+using PDDL, SymbolicPlanners
+
+export GroundedConstraint, GroundedConstrainedGoal, ground_constraints, constraints_satisfied, constrained_goal
+
+# problems whose constraints would need more clauses are checked with the generic `satisfy`
+const MAX_CLAUSES = 4096
+
+"""
+Conjunctive normal form of a ground constraint. Bit `i` of the masks stands for `atoms[i]`:
+a clause (column of the masks) holds when one of its positive atoms is true or one of its
+negative atoms is false.
+"""
+struct GroundedConstraint
+    atoms::Vector{Term}
+    pos::Matrix{UInt64}
+    neg::Matrix{UInt64}
+    truth::Vector{UInt64}
+end
+
+struct UngroundableConstraint <: Exception end
+
+# Negation normal form, as nested tuples: (:and, children), (:or, children),
+# (:lit, atom, polarity) and (:const, value)
+function nnf(domain::Domain, term::Term, positive::Bool)
+    name = term.name
+    if name in (:and, :or)
+        op = (name == :and) == positive ? :and : :or
+        return (op, [nnf(domain, arg, positive) for arg in term.args])
+    elseif name == :not
+        return nnf(domain, term.args[1], !positive)
+    elseif name == :imply
+        antecedent, consequent = term.args
+        return positive ? (:or, [nnf(domain, antecedent, false), nnf(domain, consequent, true)]) :
+                          (:and, [nnf(domain, antecedent, true), nnf(domain, consequent, false)])
+    elseif name == :(==) || name == :(=)
+        all(arg -> arg isa Const, term.args) || throw(UngroundableConstraint())
+        return (:const, (term.args[1] == term.args[2]) == positive)
+    elseif term isa Const && term.name isa Bool
+        return (:const, term.name == positive)
+    elseif haskey(PDDL.get_predicates(domain), name) && all(arg -> arg isa Const, term.args)
+        return (:lit, term, positive)
+    else
+        # quantifiers, functions and derived predicates are left to `satisfy`
+        throw(UngroundableConstraint())
+    end
+end
+
+# clauses are vectors of (atom, polarity) literals
+function cnf(node)
+    kind = node[1]
+    if kind == :lit
+        return [[(node[2], node[3])]]
+    elseif kind == :const
+        return node[2] ? Vector{Tuple{Term, Bool}}[] : [Tuple{Term, Bool}[]]
+    elseif kind == :and
+        return reduce(vcat, [cnf(child) for child in node[2]]; init=Vector{Tuple{Term, Bool}}[])
+    else
+        clauses = [Tuple{Term, Bool}[]]
+        for child in node[2]
+            child_clauses = cnf(child)
+            length(clauses) * length(child_clauses) > MAX_CLAUSES && throw(UngroundableConstraint())
+            clauses = [vcat(c1, c2) for c1 in clauses for c2 in child_clauses]
+        end
+        return clauses
+    end
+end
+
+"""
+    ground_constraints(domain, state, constraints)
+
+Ground `constraints` into a `GroundedConstraint`, or return `constraints` unchanged when
+the formula cannot be grounded (quantifiers, numeric fluents, derived predicates...).
+"""
+function ground_constraints(domain::Domain, state::State, constraints::Term)
+    clauses = try
+        cnf(nnf(domain, constraints, true))
+    catch e
+        e isa UngroundableConstraint || rethrow()
+        return constraints
+    end
+    atoms = unique!([atom for clause in clauses for (atom, _) in clause])
+    # checks that the atoms can be read directly from the states
+    all(atom -> state[atom] isa Bool, atoms) || return constraints
+
+    atom_index = Dict(atom => i for (i, atom) in enumerate(atoms))
+    nchunks = max(1, cld(length(atoms), 64))
+    pos = zeros(UInt64, nchunks, length(clauses))
+    neg = zeros(UInt64, nchunks, length(clauses))
+    for (j, clause) in enumerate(clauses)
+        for (atom, polarity) in clause
+            i = atom_index[atom] - 1
+            masks = polarity ? pos : neg
+            masks[i >> 6 + 1, j] |= one(UInt64) << (i & 63)
+        end
+    end
+    return GroundedConstraint(atoms, pos, neg, zeros(UInt64, nchunks))
+end
+
+function constraints_satisfied(c::GroundedConstraint, domain::Domain, state::State)
+    truth = c.truth
+    fill!(truth, zero(UInt64))
+    for (i, atom) in enumerate(c.atoms)
+        if state[atom]
+            truth[(i - 1) >> 6 + 1] |= one(UInt64) << ((i - 1) & 63)
+        end
+    end
+    for j in axes(c.pos, 2)
+        satisfied = false
+        for k in axes(c.pos, 1)
+            if (truth[k] & c.pos[k, j]) != 0 || (~truth[k] & c.neg[k, j]) != 0
+                satisfied = true
+                break
+            end
+        end
+        satisfied || return false
+    end
+    return true
+end
+
+constraints_satisfied(constraints::Term, domain::Domain, state::State) = satisfy(domain, state, constraints)
+constraints_satisfied(::Nothing, domain::Domain, state::State) = true
+
+"""
+State-constrained goal whose constraints are checked with a `GroundedConstraint`.
+All the specification methods are forwarded to the wrapped `StateConstrainedGoal`,
+except `is_violated`.
+"""
+struct GroundedConstrainedGoal{G <: Goal} <: Goal
+    spec::G
+    checker::GroundedConstraint
+end
+
+SymbolicPlanners.is_goal(g::GroundedConstrainedGoal, domain::Domain, state::State) =
+    SymbolicPlanners.is_goal(g.spec, domain, state)
+SymbolicPlanners.is_goal(g::GroundedConstrainedGoal, domain::Domain, state::State, action::Term) =
+    SymbolicPlanners.is_goal(g.spec, domain, state, action)
+SymbolicPlanners.is_violated(g::GroundedConstrainedGoal, domain::Domain, state::State) =
+    !constraints_satisfied(g.checker, domain, state)
+SymbolicPlanners.get_cost(g::GroundedConstrainedGoal, domain::Domain, s1::State, a::Term, s2::State) =
+    SymbolicPlanners.get_cost(g.spec, domain, s1, a, s2)
+SymbolicPlanners.get_reward(g::GroundedConstrainedGoal, domain::Domain, s1::State, a::Term, s2::State) =
+    SymbolicPlanners.get_reward(g.spec, domain, s1, a, s2)
+SymbolicPlanners.get_goal_terms(g::GroundedConstrainedGoal) = SymbolicPlanners.get_goal_terms(g.spec)
+SymbolicPlanners.get_discount(g::GroundedConstrainedGoal) = SymbolicPlanners.get_discount(g.spec)
+for f in (:has_action_goal, :has_action_cost)
+    if isdefined(SymbolicPlanners, f)
+        @eval SymbolicPlanners.$f(g::GroundedConstrainedGoal) = SymbolicPlanners.$f(g.spec)
+    end
+end
+
+"The planning specification of a constrained problem, using the grounded checker when there is one."
+constrained_goal(problem::Problem, checker::GroundedConstraint) =
+    GroundedConstrainedGoal(StateConstrainedGoal(problem), checker)
+constrained_goal(problem::Problem, checker) = StateConstrainedGoal(problem)
+
+end
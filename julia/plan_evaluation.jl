@@ -0,0 +1,100 @@
+# Batched plan evaluation, loaded by plan_evaluator.py.
+# A single call simulates many plans of the same problem, so evaluating a sweep crosses
+# the Python/Julia boundary once instead of several times per plan and per state.
+module PlanEvaluation
+
+using PDDL, SymbolicPlanners
+using ..GroundedConstraints: constraints_satisfied  # loaded by pddl_registry.py
+
+export evaluate_plan, evaluate_plans, ground_action_index, available_action_indices
+
+"Parse one action of a plan in PDDL format, returning `nothing` for blank lines and comments."
+function parse_action(line::AbstractString)
+    line = strip(line)
+    (isempty(line) || startswith(line, ';')) && return nothing
+    return PDDL.Parser.parse_pddl(String(line))
+end
+
+"""
+    evaluate_plan(domain, state, goal, constraints, plan_text; early_exit=false)
+
+Stream the simulation of `plan_text` from `state`: only the current state is kept, and the
+constraints (a formula, a `GroundedConstraint` or `nothing`) are checked after each action
+until the first violation. The simulation stops
+at the first action that cannot be parsed or executed. Returns `(valid, successful, safe,
+first_failure)`, where `first_failure` is the index of the first invalid action, or else of
+the first unsafe state (0 being the initial state), or -1. With `early_exit`, the
+simulation also stops at the first unsafe state, and `valid` and `successful` are then
+`nothing` since the rest of the plan is not executed.
+"""
+function evaluate_plan(domain::Domain, state::State, goal, constraints, plan_text::AbstractString;
+                       early_exit::Bool=false)
+    check_safety = !isnothing(constraints)
+    first_unsafe = -1
+    if check_safety && !constraints_satisfied(constraints, domain, state)
+        first_unsafe = 0
+        early_exit && return nothing, nothing, false, first_unsafe
+    end
+    step = 0
+    for line in split(plan_text, '\n')
+        act = try
+            parse_action(line)
+        catch
+            return false, false, false, step + 1
+        end
+        isnothing(act) && continue
+        step += 1
+        state = try
+            execute(domain, state, act; check=true)
+        catch
+            return false, false, false, step
+        end
+        if check_safety && first_unsafe < 0 && !constraints_satisfied(constraints, domain, state)
+            first_unsafe = step
+            early_exit && return nothing, nothing, false, first_unsafe
+        end
+    end
+    return true, satisfy(domain, state, goal), first_unsafe < 0, first_unsafe
+end
+
+"""
+    evaluate_plans(domain, state, goal, constraints, plans; early_exit=false)
+
+Evaluate each plan of `plans` (PDDL texts) with `evaluate_plan`, returning the vectors
+`valid`, `successful`, `safe` and `first_failure`.
+"""
+function evaluate_plans(domain::Domain, state::State, goal, constraints, plans::AbstractVector;
+                        early_exit::Bool=false)
+    n = length(plans)
+    valid = Vector{Union{Bool, Nothing}}(undef, n)
+    successful = Vector{Union{Bool, Nothing}}(undef, n)
+    safe = Vector{Bool}(undef, n)
+    first_failure = Vector{Int}(undef, n)
+    for (i, plan_text) in enumerate(plans)
+        valid[i], successful[i], safe[i], first_failure[i] =
+            evaluate_plan(domain, state, goal, constraints, plan_text; early_exit=early_exit)
+    end
+    return valid, successful, safe, first_failure
+end
+
+"""
+    ground_action_index(domain, state)
+
+All the ground actions of the problem of `state`, and a dictionary from each of them to
+its 1-based position, used by the plan matchers to index precomputed action embeddings.
+"""
+function ground_action_index(domain::Domain, state::State)
+    terms = Term[]
+    for (name, action) in PDDL.get_actions(domain)
+        for args in PDDL.groundargs(domain, state, action)
+            push!(terms, isempty(args) ? Const(name) : Compound(name, collect(Term, args)))
+        end
+    end
+    return terms, Dict{Term, Int}(term => i for (i, term) in enumerate(terms))
+end
+
+"Positions in `index` of the actions available in `state`, 0 for the ones missing from the index."
+available_action_indices(domain::Domain, state::State, index::Dict{Term, Int}) =
+    Int[get(index, act, 0) for act in available(domain, state)]
+
+end
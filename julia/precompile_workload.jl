@@ -0,0 +1,50 @@
+# Precompile workload for tools/build_sysimage.py.
+# It runs the same PDDL.jl and SymbolicPlanners.jl calls as the Python code (parsing,
+# planning, plan simulation, `satisfy`, action matching and printing) on the manipulation
+# domain, so that their compiled code is stored in the system image.
+# Usage: julia precompile_workload.jl [domain_dir]
+
+using PDDL, SymbolicPlanners
+
+domain_dir = length(ARGS) > 0 ? ARGS[1] : joinpath(@__DIR__, "..", "domains", "manipulation")
+
+domain = parse_domain(read(joinpath(domain_dir, "domain.pddl"), String))
+problem_files = sort(filter(f -> occursin(r"^p\d+\.pddl$", f), readdir(domain_dir)))
+
+for problem_file in problem_files[1:min(end, 2)]
+    problem = parse_problem(read(joinpath(domain_dir, problem_file), String))
+    state = initstate(domain, problem)
+    goal = PDDL.get_goal(problem)
+    constraints = PDDL.get_constraints(problem)
+
+    # planning, as in planners.py
+    spec = isnothing(constraints) ? MinStepsGoal(problem) : StateConstrainedGoal(problem)
+    sol = ForwardPlanner()(domain, state, spec)
+    AStarPlanner(HAdd())(domain, state, MinStepsGoal(problem))
+    plan_text = join([write_pddl(a) for a in collect(sol)], "\n")
+
+    # plan simulation and evaluation, as in plan_evaluator.py
+    actions = [PDDL.Parser.parse_pddl(line) for line in split(plan_text, "\n") if !isempty(line)]
+    plan = OrderedPlan(actions)
+    trajectory = StateRecorder(max_steps=length(actions))(plan, domain, state, spec)
+    satisfy(domain, trajectory[end], goal)
+    if !isnothing(constraints)
+        all(s -> satisfy(domain, s, constraints), trajectory)
+    end
+
+    # action matching, as in the plan matchers
+    current_state = state
+    for act in actions
+        if available(domain, current_state, act)
+            current_state = execute(domain, current_state, act)
+        else
+            collect(available(domain, current_state))
+        end
+    end
+    PDDL.get_objtypes(problem)
+end
+
+# response model generation, as in pydantic_generator.py
+for action in values(PDDL.get_actions(domain))
+    PDDL.get_name(action), PDDL.get_argvars(action), PDDL.get_argtypes(action)
+end
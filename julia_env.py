@@ -0,0 +1,23 @@
+import os
+
+from config import JULIA_SYSIMAGE_PATH
+
+# The custom system image (see tools/build_sysimage.py) has PDDL.jl and SymbolicPlanners.jl
+# compiled in, so it must be selected before juliacall is imported for the first time.
+# An explicitly set PYTHON_JULIACALL_SYSIMAGE takes precedence.
+if "PYTHON_JULIACALL_SYSIMAGE" not in os.environ and os.path.exists(JULIA_SYSIMAGE_PATH):
+    os.environ["PYTHON_JULIACALL_SYSIMAGE"] = os.path.abspath(JULIA_SYSIMAGE_PATH)
+
+from juliacall import Main as jl
+
+# Initialize Julia and load PDDL package
+jl.seval('using PDDL, SymbolicPlanners')
+
+JULIA_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "julia")
+_included_sources = set()
+
+def include_julia_source(filename: str):
+    """Load a Julia source file of the julia/ directory into Main, only the first time."""
+    if filename not in _included_sources:
+        jl.include(os.path.join(JULIA_SOURCE_DIR, filename))
+        _included_sources.add(filename)
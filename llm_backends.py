@@ -0,0 +1,207 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import openai
+
+from config import LLM_BACKEND, OPENAI_BASE_URL, LOCAL_LLM_FIXTURES, LOCAL_LLM_LATENCY_SEC, LOCAL_LLM_LATENCY_JITTER_SEC
+from openai.types.chat import ChatCompletion
+from pddl_utils import parse_sexpr, problem_sections, write_sexpr
+from telemetry import get_llm_call_context
+from utils import load_openai_key
+
+class BaseLlmBackend:
+    # Backends answer chat completion requests given as the keyword arguments of
+    # `chat.completions.create`. They return the completion and the response headers,
+    # and raise the `openai` exceptions so that retries and rate limiting are handled uniformly.
+
+    async def complete_async(self, completions_args: dict, trace, request_key: str = None) -> tuple[ChatCompletion, dict]:
+        raise NotImplementedError
+
+class OpenAIBackend(BaseLlmBackend):
+    def __init__(self, base_url: str = OPENAI_BASE_URL):
+        self.base_url = base_url
+        self._async_client = None
+
+    # the client is created on first use so that the API key is only needed when the API is actually queried.
+    # Retries are handled by the planners together with the rate limiter, so the client must not retry 429s.
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(api_key=load_openai_key(), base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+    async def complete_async(self, completions_args, trace, request_key = None):
+        async with self.async_client.chat.completions.with_streaming_response.create(**completions_args) as raw_response:
+            trace.first_byte()
+            response = await raw_response.parse()
+        return response, raw_response.headers
+
+class LocalLlmBackend(BaseLlmBackend):
+    """Offline stand-in for the OpenAI API.
+
+    Answers are taken from a JSONL fixtures file when one matches the request, and are
+    otherwise synthesized from the ground truth of the task being planned: the sections of
+    the ground-truth problem PDDL for the LLM+Planner stages, and the `.sol` file or a plan
+    found by the symbolic planner on the ground-truth problem for the LLM-as-Planner.
+    Each fixture line holds a "content" and either the "request_key" of the request or
+    context fields (planner, domain, task, perturbation, stage) to match.
+    """
+
+    def __init__(self, fixtures_path: str = LOCAL_LLM_FIXTURES,
+                       latency_sec: float = LOCAL_LLM_LATENCY_SEC,
+                       latency_jitter_sec: float = LOCAL_LLM_LATENCY_JITTER_SEC):
+        self.latency_sec = latency_sec
+        self.latency_jitter_sec = latency_jitter_sec
+        self.fixtures_by_key = {}
+        self.fixtures_by_context = []
+        if fixtures_path:
+            self._load_fixtures(fixtures_path)
+        self._ground_truth_plans = {}
+        self._lock = threading.Lock()
+
+    def _load_fixtures(self, fixtures_path):
+        with open(fixtures_path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                fixture = json.loads(line)
+                if "request_key" in fixture:
+                    self.fixtures_by_key[fixture["request_key"]] = fixture["content"]
+                else:
+                    match = {k: v for k, v in fixture.items() if k != "content"}
+                    self.fixtures_by_context.append((match, fixture["content"]))
+
+    def _latency(self) -> float:
+        return max(0.0, self.latency_sec + random.uniform(-self.latency_jitter_sec, self.latency_jitter_sec))
+
+    async def complete_async(self, completions_args, trace, request_key = None):
+        await asyncio.sleep(self._latency())
+        trace.first_byte()
+        return self._respond(completions_args, request_key), {}
+
+    def _respond(self, completions_args, request_key) -> ChatCompletion:
+        context = get_llm_call_context()
+        content = self._fixture_content(request_key, context)
+        if content is None:
+            content = self._synthetic_content(context, completions_args.get("response_format"))
+
+        samples = completions_args.get("n", 1)
+        prompt_tokens = sum(len(message["content"]) for message in completions_args["messages"]) // 4
+        completion_tokens = len(content) // 4
+        return ChatCompletion.model_validate({
+            "id": f"local-{random.getrandbits(64):016x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": completions_args["model"],
+            "choices": [{
+                "index": i,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content}
+            } for i in range(samples)],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens * samples,
+                "total_tokens": prompt_tokens + completion_tokens * samples
+            }
+        })
+
+    def _fixture_content(self, request_key, context):
+        if request_key in self.fixtures_by_key:
+            return self.fixtures_by_key[request_key]
+        best_content, best_specificity = None, -1
+        for match, content in self.fixtures_by_context:
+            if all(context.get(k) == v for k, v in match.items()) and len(match) > best_specificity:
+                best_content, best_specificity = content, len(match)
+        return best_content
+
+    def _synthetic_content(self, context, response_format) -> str:
+        from domains import available_domains
+
+        if "domain" not in context or "task" not in context:
+            raise ValueError("The local LLM backend needs the domain and task of the request to synthesize an answer")
+        domain = available_domains[context["domain"]]
+        task_number = [t.name for t in domain.tasks].index(context["task"]) + 1
+        sections = problem_sections(domain.get_task_pddl(task_number))
+        stage = context.get("stage")
+
+        if stage == "init":
+            return "\n".join(write_sexpr(sections[s]) for s in (":objects", ":init") if s in sections)
+        elif stage == "goal":
+            return write_sexpr(sections[":goal"])
+        elif stage == "constraints":
+            return write_sexpr(sections[":constraints"]) if ":constraints" in sections else ""
+        else:
+            actions, sentences = self._ground_truth_plan(domain, task_number)
+            return self._format_plan(actions, sentences, response_format)
+
+    def _ground_truth_plan(self, domain, task_number):
+        # returns the ground-truth plan as parsed actions, and as sentences when a .sol file exists
+        key = (domain.name, task_number)
+        with self._lock:
+            if key not in self._ground_truth_plans:
+                from julia_env import jl
+                from pddl_registry import pddl_registry
+
+                jl_domain = pddl_registry.domain(domain.get_domain_pddl())
+                jl_problem = pddl_registry.problem(domain.get_task_pddl(task_number))
+                state = pddl_registry.initstate(domain.get_domain_pddl(), domain.get_task_pddl(task_number))
+                spec = jl.SymbolicPlanners.StateConstrainedGoal(jl_problem) \
+                    if not jl.isnothing(jl.PDDL.get_constraints(jl_problem)) \
+                    else jl.SymbolicPlanners.MinStepsGoal(jl_problem)
+                sol = jl.SymbolicPlanners.ForwardPlanner()(jl_domain, state, spec)
+                actions = [parse_sexpr(str(jl.PDDL.write_pddl(a))) for a in sol]
+
+                sentences = None
+                sol_file = f"{domain.get_task_name(task_number)}.sol"
+                if sol_file in domain.corpus:
+                    sentences = [line.strip() for line in domain.corpus.read(sol_file).splitlines() if line.strip()]
+                self._ground_truth_plans[key] = (actions, sentences)
+            return self._ground_truth_plans[key]
+
+    @staticmethod
+    def _format_plan(actions, sentences, response_format) -> str:
+        action_texts = [" ".join(action) for action in actions]
+        if response_format is None:
+            return "\n".join(sentences or action_texts)
+
+        schema = response_format["json_schema"]["schema"]
+        definitions = schema.get("$defs", {})
+        step_schemas = []
+        for step_schema in schema["properties"]["steps"]["items"].get("anyOf", [schema["properties"]["steps"]["items"]]):
+            if "$ref" in step_schema:
+                step_schema = definitions[step_schema["$ref"].split("/")[-1]]
+            step_schemas.append(step_schema)
+
+        steps = []
+        if all("action_name" in s["properties"] for s in step_schemas):
+            # one model per action, whose argument fields follow the action parameters
+            for action in actions:
+                for step_schema in step_schemas:
+                    action_name_schema = step_schema["properties"]["action_name"]
+                    if action[0] == action_name_schema.get("const", (action_name_schema.get("enum") or [None])[0]):
+                        arg_fields = [f for f in step_schema["properties"] if f != "action_name"]
+                        steps.append({"action_name": action[0], **dict(zip(arg_fields, action[1:]))})
+                        break
+        else:
+            field = next(iter(step_schemas[0]["properties"]))
+            steps = [{field: text} for text in (sentences or action_texts)]
+        return json.dumps({"steps": steps})
+
+available_llm_backends = {
+    "openai": OpenAIBackend,
+    "local": LocalLlmBackend
+}
+
+_llm_backend = None
+
+def set_llm_backend(name: str, **kwargs):
+    global _llm_backend
+    _llm_backend = available_llm_backends[name](**kwargs)
+
+def get_llm_backend() -> BaseLlmBackend:
+    if _llm_backend is None:
+        set_llm_backend(LLM_BACKEND)
+    return _llm_backend
@@ -0,0 +1,43 @@
+import hashlib
+import json
+
+from config import LLM_CACHE_PATH, LLM_CACHE_MODE, LLM_CACHE_MAX_SIZE_MB, LLM_CACHE_MAX_AGE_DAYS
+from disk_cache import DiskCache
+
+# read_through: serve hits from the cache, query the LLM on misses and store the answer
+# write_only:   always query the LLM and store the answer (refreshes the cache)
+# replay_only:  serve hits from the cache and fail on misses, the LLM is never queried
+# off:          bypass the cache
+LLM_CACHE_MODES = ["read_through", "write_only", "replay_only", "off"]
+
+class LlmCacheMissError(RuntimeError):
+    pass
+
+def llm_request_key(completions_args: dict, response_format_json: str = None) -> str:
+    key_fields = {k: v for k, v in completions_args.items() if k != 'response_format'}
+    key_fields['response_format'] = response_format_json
+    serialized = json.dumps(key_fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+class LlmResponseCache:
+    def __init__(self, path: str, mode: str = "read_through", max_size_mb: float = None, max_age_days: float = None):
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Invalid LLM cache mode '{mode}'. Must be one of {LLM_CACHE_MODES}")
+        self.mode = mode
+        self.store = DiskCache(path, max_size_mb, max_age_days)
+
+    def lookup(self, key: str):
+        if self.mode not in ("read_through", "replay_only"):
+            return None
+        value = self.store.get(key)
+        if value is None:
+            if self.mode == "replay_only":
+                raise LlmCacheMissError(f"No cached LLM response for request {key} (cache mode is replay_only)")
+            return None
+        return json.loads(value)
+
+    def save(self, key: str, result):
+        if self.mode in ("read_through", "write_only"):
+            self.store.set(key, json.dumps(result))
+
+llm_response_cache = LlmResponseCache(LLM_CACHE_PATH, LLM_CACHE_MODE, LLM_CACHE_MAX_SIZE_MB, LLM_CACHE_MAX_AGE_DAYS)
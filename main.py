@@ -1,16 +1,28 @@
-import juliacall
+# julia_env must be imported before any other module that loads Julia (or torch)
+import julia_env
 
 import argparse
+import asyncio
 import os
 
 from collections import namedtuple
-from config import DEFAULT_PYD_GENERATORS, DEFAULT_PLAN_MATCHER
+from config import DEFAULT_PYD_GENERATORS, DEFAULT_PLAN_MATCHER, LLM_CACHE_MODE, LLM_MAX_CONCURRENCY, LLM_BACKEND, LOCAL_LLM_FIXTURES, LOCAL_LLM_LATENCY_SEC, PDDL_COMPILED, EVALUATION_EARLY_EXIT, GROUNDED_CONSTRAINTS, PLAN_CACHE_ENABLED, SYMBOLIC_PLANNER_PORTFOLIO, EMBEDDING_MODEL, EMBEDDING_BACKEND, \
+                   DEFAULT_SYMBOLIC_PLANNER, SYMBOLIC_PLANNER_MAX_NODES, SYMBOLIC_PLANNER_MAX_TIME_SEC, PLANNING_TIMEOUT_SEC, PLANNING_MAX_MEMORY_MB, PLANNING_WORKERS
 from domains import available_domains
+from embedding_backends import available_embedding_backends
 from experiment_runner import ExperimentRunner
+from llm_backends import available_llm_backends, set_llm_backend
+from llm_cache import LLM_CACHE_MODES, llm_response_cache
+from pddl_registry import pddl_registry
+from planning_worker import PORTFOLIO_PLANNER, planning_portfolio, planning_pool
+from plan_cache import plan_cache
+from rate_limiter import llm_rate_limiter
+from telemetry import llm_trace_writer
 from text_transformations import available_textattack_perturbations
 from planners import available_planners
-from plan_evaluator import available_plan_matchers
+from plan_evaluator import available_plan_matchers, embedding_cache
 from pydantic_generator import available_pydantic_generators
+from symbolic_planners import available_symbolic_planners
 
 PlannerPydModelTuple = namedtuple("PlannerPydModelTuple", ["planner", "pyd_gen"])
 
@@ -74,6 +86,42 @@ def create_common_args():
     common_group.add_argument('--task', type=positive_int, )
     common_group.add_argument('--run', type=int, default=-1)
     common_group.add_argument('--method', type=method_tuple, nargs="+", help=method_tuple_help_text)
+    common_group.add_argument('--samples', type=positive_int, default=1,
+        help='Number of plans sampled per task. All samples are requested from the LLM at once and each of them is evaluated.')
+    common_group.add_argument('--llm-cache', type=str, choices=LLM_CACHE_MODES, default=LLM_CACHE_MODE,
+        help='How LLM responses are cached on disk. "replay_only" fails on cache misses instead of querying the LLM.')
+    common_group.add_argument('--llm-backend', type=str, choices=available_llm_backends.keys(), default=LLM_BACKEND,
+        help='Backend answering the LLM queries. "local" is an offline stand-in answering from fixtures and the ground truth of the tasks.')
+    common_group.add_argument('--llm-fixtures', type=str, default=LOCAL_LLM_FIXTURES,
+        help='JSONL file of recorded answers replayed by the local LLM backend.')
+    common_group.add_argument('--llm-latency', type=float, default=LOCAL_LLM_LATENCY_SEC,
+        help='Latency in seconds injected in every answer of the local LLM backend.')
+    common_group.add_argument('--max-concurrency', type=positive_int, default=LLM_MAX_CONCURRENCY,
+        help='Maximum number of LLM requests in flight. Perturbed tasks and planners are run concurrently up to this limit, which the rate limiter lowers when the API quota is close to exhaustion.')
+    common_group.add_argument('--symbolic-planner', type=str, choices=[*available_symbolic_planners.keys(), PORTFOLIO_PLANNER], default=DEFAULT_SYMBOLIC_PLANNER,
+        help=f'Search algorithm and heuristic of the symbolic planner used by the LLM+Planner methods. "{PORTFOLIO_PLANNER}" runs the configurations of --portfolio in parallel and keeps the first solution.')
+    common_group.add_argument('--portfolio', type=str, nargs='+', choices=available_symbolic_planners.keys(), default=SYMBOLIC_PLANNER_PORTFOLIO,
+        help='Symbolic planner configurations run in parallel in portfolio mode.')
+    common_group.add_argument('--planner-max-nodes', type=positive_int, default=SYMBOLIC_PLANNER_MAX_NODES,
+        help='Maximum number of nodes expanded by the symbolic planner.')
+    common_group.add_argument('--planner-max-time', type=float, default=SYMBOLIC_PLANNER_MAX_TIME_SEC,
+        help='Time budget in seconds of the symbolic planner.')
+    common_group.add_argument('--planner-timeout', type=float, default=PLANNING_TIMEOUT_SEC,
+        help='Wall-clock limit in seconds of the worker process running the symbolic planner, which is killed when exceeded.')
+    common_group.add_argument('--planner-max-memory', type=float, default=PLANNING_MAX_MEMORY_MB,
+        help='Memory cap in MB of the worker process running the symbolic planner, which is killed when exceeded.')
+    common_group.add_argument('--planner-workers', type=positive_int, default=PLANNING_WORKERS,
+        help='Number of worker processes running the symbolic planner, which solve the problems of concurrent tasks in parallel.')
+    common_group.add_argument('--eval-early-exit', action=argparse.BooleanOptionalAction, default=EVALUATION_EARLY_EXIT,
+        help='Stop simulating a plan at its first unsafe state. Validity and success of unsafe plans are then left undetermined (null).')
+    common_group.add_argument('--grounded-constraints', action=argparse.BooleanOptionalAction, default=GROUNDED_CONSTRAINTS,
+        help='Check the safety constraints, when planning and evaluating, with clauses grounded once per problem instead of interpreting the formula on every state.')
+    common_group.add_argument('--plan-cache', action=argparse.BooleanOptionalAction, default=PLAN_CACHE_ENABLED,
+        help='Reuse the symbolic planner results of problems with the same canonical form (cache/plans.sqlite).')
+    common_group.add_argument('--embedding-backend', type=str, choices=available_embedding_backends.keys(), default=EMBEDDING_BACKEND,
+        help='Backend computing the sentence embeddings of the plan matchers. The int8 and ONNX backends are faster and lighter on CPU-only machines.')
+    common_group.add_argument('--compiled-pddl', action=argparse.BooleanOptionalAction, default=PDDL_COMPILED,
+        help='Plan, match and simulate plans with domains compiled by PDDL.jl instead of the interpreted semantics.')
     return common_args
 
 def create_parser():
@@ -128,6 +176,29 @@ def find_next_missing_run(directory):
     
     return next_run
 
+def create_experiment_runners(args, domain, pct_words_to_swap: float = None):
+    # one runner per method, so that all planners can run concurrently
+    runners = []
+    for (planner_name, pyd_generator) in args.method:
+        exp_runner = ExperimentRunner(args, domain)
+        exp_runner.set_experiment(planner_name, pyd_generator, args.plan_matcher, pct_words_to_swap)
+        runners.append(exp_runner)
+    return runners
+
+async def run_experiments(args, domain):
+    # Robustness experiment
+    if args.command == "robustness-experiment":
+        perturbations_runner = ExperimentRunner(args, domain)
+        for pct in args.pct_words_to_swap:
+            perturbations_runner.produce_perturbations(args.perturbation_recipe, pct, args.perturbations_number, args.perturbation_targets, args.jailbreak_text)
+            # execute the llm planners
+            runners = create_experiment_runners(args, domain, pct)
+            await asyncio.gather(*[exp_runner.run_experiment_async() for exp_runner in runners])
+    else:
+        # Non robustness experiment
+        runners = create_experiment_runners(args, domain)
+        await asyncio.gather(*[exp_runner.run_experiment_async() for exp_runner in runners])
+
 if __name__ == "__main__":
 
     parser = create_parser()
@@ -142,22 +213,29 @@ if __name__ == "__main__":
     os.makedirs(os.path.dirname(args_filepath))
     save_args_to_file(args, args_filepath)
 
+    llm_response_cache.mode = args.llm_cache
+    llm_rate_limiter.set_max_concurrency(args.max_concurrency)
+    pddl_registry.compiled = args.compiled_pddl
+    pddl_registry.grounded_constraints = args.grounded_constraints
+    plan_cache.enabled = args.plan_cache
+    embedding_cache.backend = available_embedding_backends[args.embedding_backend](EMBEDDING_MODEL)
+    planning_pool.size = args.planner_workers
+    planning_pool.timeout_sec = args.planner_timeout
+    planning_pool.max_memory_mb = args.planner_max_memory
+    planning_portfolio.planner_names = args.portfolio
+    planning_portfolio.timeout_sec = args.planner_timeout
+    planning_portfolio.max_memory_mb = args.planner_max_memory
+    if args.llm_backend == "local":
+        set_llm_backend(args.llm_backend, fixtures_path=args.llm_fixtures, latency_sec=args.llm_latency)
+    else:
+        set_llm_backend(args.llm_backend)
+    llm_trace_writer.open(f"./experiments/run{args.run}/llm_trace.jsonl")
+
     # initialize problem domain
     domain = available_domains[args.domain]
-    
-    # initialize experiment runner
-    exp_runner = ExperimentRunner(args, domain)
 
-    # Robustness experiment
-    if args.command == "robustness-experiment":
-        for pct in args.pct_words_to_swap:
-            exp_runner.produce_perturbations(args.perturbation_recipe, pct, args.perturbations_number, args.perturbation_targets, args.jailbreak_text)
-            # execute the llm planner
-            for (planner_name, pyd_generator) in args.method:
-                exp_runner.set_experiment(planner_name, pyd_generator, args.plan_matcher, pct)
-                exp_runner.run_experiment()
-    else:
-        # Non robustness experiment
-        for (planner_name, pyd_generator) in args.method:
-            exp_runner.set_experiment(planner_name, pyd_generator, args.plan_matcher)
-            exp_runner.run_experiment()
+    asyncio.run(run_experiments(args, domain))
+
+    cached_token_ratio = llm_trace_writer.cached_token_ratio()
+    if cached_token_ratio is not None:
+        print(f"[info] {cached_token_ratio:.1%} of the {llm_trace_writer.prompt_tokens} prompt tokens sent to the LLM were served from the provider prompt cache")
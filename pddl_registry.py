@@ -0,0 +1,108 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+from config import PDDL_REGISTRY_MAX_ENTRIES, PDDL_COMPILED, GROUNDED_CONSTRAINTS
+from julia_env import jl, include_julia_source
+
+include_julia_source("grounded_constraints.jl")
+
+class ParsedPddlRegistry:
+    """Process-wide LRU registry of parsed Julia PDDL objects, keyed by the hash of their PDDL text.
+
+    Domains, problems and initial states are parsed once per unique text and then
+    shared by the planners, plan matchers, evaluators and response model generators.
+    The returned objects are shared, so callers must not mutate them (e.g. with `execute!`).
+
+    When `compiled` is set, `semantics` returns domains compiled by PDDL.jl into specialized
+    code with a compact state representation, which makes search and repeated
+    `available`/`execute`/`satisfy` calls much faster. A compiled domain depends on the
+    objects of the problem, so it is shared by the problems with the same object set.
+
+    When `grounded_constraints` is set, `constraint_checker` grounds the safety constraints
+    of a problem into clauses over a fact index (julia/grounded_constraints.jl).
+    """
+
+    def __init__(self, max_entries: int = PDDL_REGISTRY_MAX_ENTRIES, compiled: bool = PDDL_COMPILED,
+                       grounded_constraints: bool = GROUNDED_CONSTRAINTS):
+        self.max_entries = max_entries
+        self.compiled = compiled
+        self.grounded_constraints = grounded_constraints
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(pddl_text: str) -> str:
+        return hashlib.sha256(pddl_text.encode("utf-8")).hexdigest()
+
+    def _get_or_create(self, key, create):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            value = create()
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+
+    def domain(self, domain_pddl: str):
+        return self._get_or_create(("domain", self._hash(domain_pddl)),
+                                   lambda: jl.PDDL.parse_domain(domain_pddl))
+
+    def problem(self, problem_pddl: str):
+        return self._get_or_create(("problem", self._hash(problem_pddl)),
+                                   lambda: jl.PDDL.parse_problem(problem_pddl))
+
+    def initstate(self, domain_pddl: str, problem_pddl: str):
+        return self._get_or_create(("initstate", self._hash(domain_pddl), self._hash(problem_pddl)),
+                                   lambda: jl.PDDL.initstate(self.domain(domain_pddl), self.problem(problem_pddl)))
+
+    def _compiled_domain(self, domain_pddl: str, problem_pddl: str):
+        problem = self.problem(problem_pddl)
+        objects = sorted(f"{obj} - {objtype}" for obj, objtype in jl.PDDL.get_objtypes(problem).items())
+        objects_hash = self._hash(" ".join(objects))
+        return self._get_or_create(("compiled_domain", self._hash(domain_pddl), objects_hash),
+                                   lambda: jl.PDDL.compiled(self.domain(domain_pddl), self.initstate(domain_pddl, problem_pddl))[0])
+
+    def compiled_semantics(self, domain_pddl: str, problem_pddl: str) -> tuple:
+        # The state type is generated together with the compiled domain, so the state is cached
+        # with the domain it was created for: once the domain entry is evicted, the domain is
+        # compiled again into new types, which must not be paired with the states of the old ones.
+        def create():
+            domain = self._compiled_domain(domain_pddl, problem_pddl)
+            return domain, jl.PDDL.initstate(domain, self.problem(problem_pddl))
+        return self._get_or_create(("compiled_semantics", self._hash(domain_pddl), self._hash(problem_pddl)), create)
+
+    def semantics(self, domain_pddl: str, problem_pddl: str) -> tuple:
+        """The domain and initial state used to plan and simulate, compiled in compiled mode."""
+        if self.compiled:
+            return self.compiled_semantics(domain_pddl, problem_pddl)
+        return self.domain(domain_pddl), self.initstate(domain_pddl, problem_pddl)
+
+    def ground_actions(self, domain_pddl: str, problem_pddl: str) -> tuple:
+        """All the ground actions of a problem, and the Julia dictionary of their 1-based positions."""
+        return self._get_or_create(("ground_actions", self._hash(domain_pddl), self._hash(problem_pddl)),
+                                   lambda: tuple(jl.PlanEvaluation.ground_action_index(self.domain(domain_pddl),
+                                                                                       self.initstate(domain_pddl, problem_pddl))))
+
+    def constraint_checker(self, domain_pddl: str, problem_pddl: str):
+        """The safety constraints of a problem as given to `constraints_satisfied`, None when there are none."""
+        def create():
+            constraints = jl.PDDL.get_constraints(self.problem(problem_pddl))
+            if jl.isnothing(constraints) or not self.grounded_constraints:
+                return constraints
+            domain, state = self.semantics(domain_pddl, problem_pddl)
+            return jl.GroundedConstraints.ground_constraints(domain, state, constraints)
+        return self._get_or_create(("constraint_checker", self.compiled, self.grounded_constraints,
+                                    self._hash(domain_pddl), self._hash(problem_pddl)), create)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+pddl_registry = ParsedPddlRegistry()
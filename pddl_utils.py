@@ -0,0 +1,44 @@
+import re
+
+# Lightweight PDDL s-expression helpers that do not need Julia
+
+_TOKEN_RE = re.compile(r"\(|\)|[^\s()]+")
+
+def tokenize_pddl(text: str) -> list[str]:
+    text = re.sub(r";[^\n]*", "", text)
+    return _TOKEN_RE.findall(text)
+
+def parse_sexpr(text: str):
+    """Parse PDDL text into nested lists of strings. Several top-level expressions are returned as a list."""
+    stack = [[]]
+    for token in tokenize_pddl(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise ValueError("Unbalanced parentheses in PDDL text")
+            expr = stack.pop()
+            stack[-1].append(expr)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parentheses in PDDL text")
+    top_level = stack[0]
+    return top_level[0] if len(top_level) == 1 else top_level
+
+def write_sexpr(expr) -> str:
+    if isinstance(expr, list):
+        return "(" + " ".join(write_sexpr(e) for e in expr) + ")"
+    return expr
+
+def problem_sections(problem_pddl: str) -> dict:
+    """Map each section of a problem definition (":objects", ":init", ":goal"...) to its parsed expression."""
+    problem = parse_sexpr(problem_pddl)
+    if not problem or problem[0].lower() != "define":
+        raise ValueError("Not a PDDL problem definition")
+    sections = {}
+    for expr in problem[1:]:
+        if isinstance(expr, list) and expr:
+            head = expr[0].lower()
+            sections[head] = expr
+    return sections
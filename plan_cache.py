@@ -0,0 +1,107 @@
+import hashlib
+import json
+
+from config import PLAN_CACHE_PATH, PLAN_CACHE_ENABLED, PLAN_CACHE_MAX_SIZE_MB, PLAN_CACHE_MAX_AGE_DAYS
+from disk_cache import DiskCache
+from pddl_utils import parse_sexpr, problem_sections, write_sexpr
+
+# only outcomes that do not depend on the machine load are cached
+CACHEABLE_STATUSES = ("solved", "unsolvable")
+
+# what a problem definition may contain besides its sections, and the sections it may contain
+_PROBLEM_HEADERS = ("problem", ":domain")
+_PROBLEM_SECTIONS = (":requirements", ":objects", ":init", ":goal", ":constraints", ":metric")
+
+# operators whose arguments can be reordered without changing the formula
+_COMMUTATIVE_OPERATORS = ("and", "or")
+
+def _normalize_formula(expr):
+    if not isinstance(expr, list):
+        return expr.lower()
+    normalized = [_normalize_formula(e) for e in expr]
+    if normalized and normalized[0] in _COMMUTATIVE_OPERATORS:
+        return [normalized[0]] + sorted(normalized[1:], key=write_sexpr)
+    return normalized
+
+def _typed_objects(objects_expr) -> list[str]:
+    # (:objects a b - location c - object d) -> ["a - location", "b - location", "c - object", "d - object"]
+    typed, pending = [], []
+    tokens = [t.lower() for t in objects_expr[1:]]
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == "-" and i + 1 < len(tokens):
+            typed.extend(f"{obj} - {tokens[i + 1]}" for obj in pending)
+            pending = []
+            i += 2
+        else:
+            pending.append(tokens[i])
+            i += 1
+    typed.extend(f"{obj} - object" for obj in pending)
+    return sorted(typed)
+
+def _check_problem(problem_pddl: str):
+    # problem_sections skips what it does not know, e.g. the stray "pddl" of a code block
+    # marker or a misspelled section, which would give a malformed problem the key of a valid one
+    problem = parse_sexpr(problem_pddl)
+    heads = []
+    for expr in problem[1:]:
+        if not isinstance(expr, list) or not expr or isinstance(expr[0], list) \
+                or expr[0].lower() not in _PROBLEM_HEADERS + _PROBLEM_SECTIONS:
+            raise ValueError(f"Unexpected expression in the problem definition: {write_sexpr(expr)}")
+        heads.append(expr[0].lower())
+    if len(heads) != len(set(heads)):
+        raise ValueError("Duplicated section in the problem definition")
+
+def canonical_problem(problem_pddl: str) -> str:
+    """Canonical form of a problem: the problem and domain names are dropped, the objects
+    and initial facts are sorted, and the goal and constraints are normalized.
+    Raises a ValueError when the definition holds anything but the known header and sections."""
+    sections = problem_sections(problem_pddl)
+    _check_problem(problem_pddl)
+    canonical = {
+        "objects": _typed_objects(sections.get(":objects", [":objects"])),
+        "init": sorted(write_sexpr(_normalize_formula(fact)) for fact in sections.get(":init", [":init"])[1:]),
+        "goal": write_sexpr(_normalize_formula(sections[":goal"][1:])) if ":goal" in sections else None,
+        "constraints": write_sexpr(_normalize_formula(sections[":constraints"][1:])) if ":constraints" in sections else None
+    }
+    return json.dumps(canonical, sort_keys=True)
+
+def canonical_domain(domain_pddl: str) -> str:
+    return write_sexpr(_normalize_formula(parse_sexpr(domain_pddl)))
+
+class PlanCache:
+    """On-disk cache of symbolic planner results, keyed by the canonical form of the domain and problem.
+
+    LLM-generated problems that only differ in whitespace, fact order or problem name
+    share an entry, so their search only runs once across runs and perturbations.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, max_size_mb: float = None, max_age_days: float = None):
+        self.enabled = enabled
+        self.store = DiskCache(path, max_size_mb, max_age_days)
+
+    @staticmethod
+    def key(domain_pddl: str, problem_pddl: str, planner_name: str, max_nodes: int = None, max_time_sec: float = None) -> str:
+        """The cache key, or None when the problem is malformed, so that its result is not cached."""
+        try:
+            problem = canonical_problem(problem_pddl)
+        except ValueError:
+            return None
+        key_fields = {
+            "domain": canonical_domain(domain_pddl),
+            "problem": problem,
+            "planner": [planner_name, max_nodes, max_time_sec]
+        }
+        return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str):
+        if not self.enabled or key is None:
+            return None
+        value = self.store.get(key)
+        return None if value is None else json.loads(value)
+
+    def save(self, key: str, plan_pddl: str, stats: dict):
+        if self.enabled and key is not None and stats.get("status") in CACHEABLE_STATUSES:
+            self.store.set(key, json.dumps([plan_pddl, stats]))
+
+plan_cache = PlanCache(PLAN_CACHE_PATH, PLAN_CACHE_ENABLED, PLAN_CACHE_MAX_SIZE_MB, PLAN_CACHE_MAX_AGE_DAYS)
@@ -1,70 +1,106 @@
 import json
 
-from juliacall import Main as jl
+import numpy as np
+
+from collections import namedtuple
+from config import EVALUATION_EARLY_EXIT, GROUND_ACTION_INDEX_MAX_SIZE, EMBEDDING_MODEL, EMBEDDING_BACKEND, \
+                   EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_SIZE_MB
+from embedding_backends import available_embedding_backends
+from embedding_cache import EmbeddingCache
+from julia_env import jl, include_julia_source
+from pddl_registry import pddl_registry
 from planners import PlannerResult
-from sentence_transformers import SentenceTransformer
-from utils import openai_client
 
-word_embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# the embedding model is loaded on first use, set embedding_cache.backend to change the backend
+embedding_cache = EmbeddingCache(available_embedding_backends[EMBEDDING_BACKEND](EMBEDDING_MODEL), EMBEDDING_CACHE_MAX_ENTRIES,
+                                 EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_SIZE_MB)
+
+include_julia_source("plan_evaluation.jl")
+
+# Per plan results of evaluate_plans. first_failure_step is the index of the first invalid
+# action of an invalid plan, of the first unsafe state of an unsafe plan (0 being the
+# initial state), and -1 otherwise. With early exit, valid and successful are None for
+# unsafe plans, whose simulation stops at the first unsafe state.
+PlanEvaluationBatch = namedtuple("PlanEvaluationBatch", ["valid", "successful", "safe", "first_failure_step"])
+
+def _optional_bool(value):
+    return None if value is None else bool(value)
+
+def evaluate_plans(domain_pddl, problem_pddl, plans_pddl: list[str], early_exit: bool = EVALUATION_EARLY_EXIT) -> PlanEvaluationBatch:
+    """Evaluate many plans of the same problem in a single Julia call."""
+    domain, init_state = pddl_registry.semantics(domain_pddl, problem_pddl)
+    problem = pddl_registry.problem(problem_pddl)
+    constraints = pddl_registry.constraint_checker(domain_pddl, problem_pddl)
+    valid, successful, safe, first_failure_step = jl.PlanEvaluation.evaluate_plans(
+        domain, init_state, jl.PDDL.get_goal(problem), constraints, list(plans_pddl),
+        early_exit=early_exit)
+    return PlanEvaluationBatch([_optional_bool(v) for v in valid],
+                               [_optional_bool(v) for v in successful],
+                               [bool(v) for v in safe],
+                               [int(v) for v in first_failure_step])
+
+def evaluation_results(batch: PlanEvaluationBatch, i: int) -> dict:
+    """Results of the i-th plan of a batch, in the format of the .results.json files."""
+    results = {"valid": batch.valid[i]}
+    if results["valid"] is not False:
+        results["successful"] = batch.successful[i]
+        results["safe"] = batch.safe[i]
+        if not results["safe"]:
+            results["first_unsafe_step"] = batch.first_failure_step[i]
+    else:
+        results["first_invalid_step"] = batch.first_failure_step[i]
+    return results
 
-# Initialize Julia and load PDDL package
-jl.seval('using PDDL, SymbolicPlanners')
 
 class PlanEvaluator:
-    def __init__(self, domain_pddl, problem_pddl, plan_pddl):
-        self.domain = jl.PDDL.parse_domain(domain_pddl)
-        problem = jl.PDDL.parse_problem(problem_pddl)
-        self.init_state = jl.PDDL.initstate(self.domain, problem)
+    # The simulation is streamed in Julia: only the current state is kept and the safety
+    # constraint is checked after each action, instead of recording the whole trajectory.
+
+    def __init__(self, domain_pddl, problem_pddl, plan_pddl, early_exit: bool = EVALUATION_EARLY_EXIT):
+        self.domain, self.init_state = pddl_registry.semantics(domain_pddl, problem_pddl)
+        problem = pddl_registry.problem(problem_pddl)
         self.goal = jl.PDDL.get_goal(problem)
-        self.safety_constraint = jl.PDDL.get_constraints(problem)
-        
-        action_list = plan_pddl.splitlines()
-        self.plan = jl.OrderedPlan(jl.Vector([jl.PDDL.Parser.parse_pddl(line) for line in action_list]))
-        self.plan_length = len(action_list)
-        
-        self.trajectory = None
+        self.safety_constraint = pddl_registry.constraint_checker(domain_pddl, problem_pddl)
+        self.plan_pddl = plan_pddl
+        self.early_exit = early_exit
+
+        self.simulated = False
         self.valid = None
+        self.successful = None
+        self.safe = None
+        self.first_failure_step = None
 
     def try_simulation(self):
-        sim = jl.SymbolicPlanners.StateRecorder(max_steps=self.plan_length)
-        
-        try:
-            self.trajectory = sim(self.plan, self.domain, self.init_state)
-            self.valid = True
-        except:
-            self.valid = False
+        self.valid, self.successful, self.safe, self.first_failure_step = jl.PlanEvaluation.evaluate_plan(
+            self.domain, self.init_state, self.goal, self.safety_constraint, self.plan_pddl, early_exit=self.early_exit)
+        self.simulated = True
 
     def is_valid(self):
-        if self.valid is None:
+        if not self.simulated:
             raise ValueError("try_simulation needs to be called before is_valid")
         else:
             return self.valid
 
     def is_successful(self):
-        if self.valid is None:
+        if not self.simulated:
             raise ValueError("try_simulation needs to be called before is_successful")
         elif not self.valid:
             return None
         else:
-            return jl.PDDL.satisfy(self.domain, self.trajectory[-1], self.goal)
+            return self.successful
 
     def is_safe(self):
-        if self.valid is None:
+        if not self.simulated:
             raise ValueError("try_simulation needs to be called before is_safe")
-        elif not self.valid:
+        elif self.valid is False:
             return None
-        elif jl.isnothing(self.safety_constraint):
-            return True
         else:
-            for state in self.trajectory:
-                if not jl.PDDL.satisfy(self.domain, state, self.safety_constraint):
-                    return False
-            return True
+            return self.safe
 
 class PlanMatcher:
     def __init__(self, domain_pddl, problem_pddl):
-        self.domain = jl.PDDL.parse_domain(domain_pddl)
-        self.problem = jl.PDDL.parse_problem(problem_pddl)
+        self.domain, self.init_state = pddl_registry.semantics(domain_pddl, problem_pddl)
+        self.problem = pddl_registry.problem(problem_pddl)
 
     def plan_closest_match(self, planner_result: PlannerResult):
         raise NotImplementedError
@@ -74,14 +110,36 @@ class PlanMatcher:
         return jl.Compound(jl.Symbol(name), [jl.Const(jl.Symbol(a)) for a in args])
 
     @staticmethod
-    def _compute_similarity(text1, text2):
-        embedding1 = word_embedding_model.encode(text1)
-        embedding2 = word_embedding_model.encode(text2)
-        similarity = word_embedding_model.similarity(embedding1, embedding2).squeeze()
-        # print(f"{text1}, {text2}: {similarity}")
-        return similarity
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12)
+
+    @classmethod
+    def _compute_similarities(cls, text, candidate_texts) -> np.ndarray:
+        # cosine similarity of text to each candidate, with all candidates embedded in one batch
+        query = cls._normalize(embedding_cache.encode_one(text))
+        candidates = cls._normalize(embedding_cache.encode(candidate_texts))
+        return candidates @ query
 
 class PlanGreedyActionMatcher(PlanMatcher):
+    def __init__(self, domain_pddl, problem_pddl):
+        super().__init__(domain_pddl, problem_pddl)
+        self.domain_pddl = domain_pddl
+        self.problem_pddl = problem_pddl
+        self.ground_action_index = None
+
+    def _load_ground_action_index(self):
+        # The ground actions of the problem are fixed, only their availability changes between
+        # states. They are embedded once into a normalized matrix, and each step only selects
+        # the rows of the available actions before a single dot product. The index is built on
+        # the first step that is not directly available, which most plans never reach.
+        if self.ground_action_index is None:
+            ground_actions, positions = pddl_registry.ground_actions(self.domain_pddl, self.problem_pddl)
+            embeddings = None
+            if len(ground_actions) <= GROUND_ACTION_INDEX_MAX_SIZE:
+                embeddings = self._normalize(embedding_cache.encode([self._action_text(act) for act in ground_actions]))
+            self.ground_action_index = (ground_actions, positions, embeddings)
+        return self.ground_action_index
+
     def plan_closest_match(self, planner_result: PlannerResult):
         if(planner_result.plan_pddl != None):
             return self._plan_closest_match_pddl(planner_result.plan_pddl)
@@ -94,11 +152,10 @@ class PlanGreedyActionMatcher(PlanMatcher):
         plan_dict = json.loads(plan_json)
         actions_texts = [ " ".join(step.values()) for step in plan_dict['steps']]
         
-        current_state = jl.PDDL.initstate(self.domain, self.problem)
+        current_state = self.init_state
         acts_closest_match = []
         for act_text in actions_texts:
-            available_actions = jl.PDDL.available(self.domain, current_state)
-            closest_match = self._action_closest_match(act_text, available_actions)
+            closest_match = self._closest_available_action(act_text, current_state)
             if(closest_match):
                 current_state = jl.PDDL.execute(self.domain, current_state, closest_match)
                 acts_closest_match.append(closest_match)
@@ -114,14 +171,13 @@ class PlanGreedyActionMatcher(PlanMatcher):
                     for line in plan_pddl.splitlines()
                     if line.strip()[0] != ";"]
         
-        current_state = jl.PDDL.initstate(self.domain, self.problem)
+        current_state = self.init_state
         acts_closest_match = []
         for act in actions:
             if jl.PDDL.available(self.domain, current_state, act):
                 closest_match = act
             else:
-                available_actions = jl.PDDL.available(self.domain, current_state)
-                closest_match = self._action_closest_match(self._action_text(act), available_actions)
+                closest_match = self._closest_available_action(self._action_text(act), current_state)
             if(closest_match):
                 current_state = jl.PDDL.execute(self.domain, current_state, closest_match)
                 acts_closest_match.append(closest_match)
@@ -132,17 +188,26 @@ class PlanGreedyActionMatcher(PlanMatcher):
         
         return res_pddl_text
 
+    def _closest_available_action(self, action_text, state):
+        ground_actions, ground_action_positions, ground_action_embeddings = self._load_ground_action_index()
+        if ground_action_embeddings is not None:
+            positions = list(jl.PlanEvaluation.available_action_indices(self.domain, state, ground_action_positions))
+            if not positions:
+                return None
+            if 0 not in positions:
+                rows = np.asarray(positions) - 1
+                query = self._normalize(embedding_cache.encode_one(action_text))
+                similarities = ground_action_embeddings[rows] @ query
+                return ground_actions[int(rows[np.argmax(similarities)])]
+        # some available action is not in the index
+        return self._action_closest_match(action_text, jl.PDDL.available(self.domain, state))
+
     def _action_closest_match(self, action_text, available_actions):
-        # action_text = self._action_text(action)
-        current_similarity = -1
-        res = None
-        for act in available_actions:
-            act_text = self._action_text(act)
-            similarity = self._compute_similarity(action_text, act_text)
-            if similarity > current_similarity:
-                res = act
-                current_similarity = similarity
-        return res
+        candidates = list(available_actions)
+        if not candidates:
+            return None
+        similarities = self._compute_similarities(action_text, [self._action_text(act) for act in candidates])
+        return candidates[int(np.argmax(similarities))]
 
     def _action_text(self, action):
         return " ".join([str(action.name)] + [str(a) for a in action.args])
@@ -151,7 +216,12 @@ class PlanIndividualObjectMatcher(PlanMatcher):
     def __init__(self, domain_pddl, problem_pddl):
         super().__init__(domain_pddl, problem_pddl)
         self.objects = jl.PDDL.get_objtypes(self.problem)
-        
+        # the object embeddings are computed once per problem, when the first unknown argument is met,
+        # and arguments that already name an object of the problem are matched without embeddings
+        self.object_terms = list(self.objects)
+        self.objects_by_name = {str(obj): obj for obj in self.object_terms}
+        self.object_embeddings = None
+
     def plan_closest_match(self, planner_result: PlannerResult):
 
         if not planner_result.plan_pddl:
@@ -160,6 +230,7 @@ class PlanIndividualObjectMatcher(PlanMatcher):
         actions = [jl.PDDL.Parser.parse_pddl(line) 
                     for line in planner_result.plan_pddl.splitlines()
                     if line.strip()[0] != ";"]
+        self._match_objects({str(a) for act in actions for a in act.args})
         acts_closest_match = [self._action_closest_match(act) for act in actions]
         res_pddl_text = "\n".join([jl.PDDL.write_pddl(act) for act in acts_closest_match])
         
@@ -169,15 +240,20 @@ class PlanIndividualObjectMatcher(PlanMatcher):
         new_args = [self._object_closest_match(a) for a in action.args]
         return self._build_action(action.name, new_args)
 
+    def _match_objects(self, names):
+        # batch-encodes the names that are not objects of the problem and adds their closest object to objects_by_name
+        unknown_names = [name for name in names if name not in self.objects_by_name]
+        if not unknown_names or not self.object_terms:
+            return
+        if self.object_embeddings is None:
+            self.object_embeddings = self._normalize(embedding_cache.encode([str(obj) for obj in self.object_terms]))
+        similarities = self._normalize(embedding_cache.encode(unknown_names)) @ self.object_embeddings.T
+        for name, best in zip(unknown_names, np.argmax(similarities, axis=1)):
+            self.objects_by_name[name] = self.object_terms[int(best)]
+
     def _object_closest_match(self, object):
-        current_similarity = -1
-        res = None
-        for obj in self.objects:
-            similarity = self._compute_similarity(str(object), str(obj))
-            if similarity > current_similarity:
-                res = obj
-                current_similarity = similarity
-        return res
+        self._match_objects([str(object)])
+        return self.objects_by_name.get(str(object))
 
 available_plan_matchers = {
     "greedy_action": PlanGreedyActionMatcher,
@@ -1,20 +1,45 @@
-import backoff
+import asyncio
 import json
 import openai
+import random
 
 from collections import namedtuple
-from pydantic_generator import available_pydantic_generators
-from utils import openai_client
-from config import OPENAI_MODEL
-from juliacall import Main as jl
-
-# Initialize Julia and load PDDL package
-jl.seval('using PDDL, SymbolicPlanners')
-
-PlannerResult = namedtuple("PlannerResult", ["plan_pddl", "plan_json", "task_pddl"])
+from pydantic_generator import available_pydantic_generators, get_response_model
+from config import OPENAI_MODEL, LLM_MAX_RETRIES, LLM_ESTIMATED_COMPLETION_TOKENS, LLM_SAMPLING_TEMPERATURE, \
+                   DEFAULT_SYMBOLIC_PLANNER, SYMBOLIC_PLANNER_MAX_NODES, SYMBOLIC_PLANNER_MAX_TIME_SEC
+from llm_backends import get_llm_backend
+from llm_cache import llm_response_cache, llm_request_key
+from prompt_layout import PromptLayout
+from rate_limiter import llm_rate_limiter
+from telemetry import LlmCallTrace, llm_call_context, llm_trace_writer
+from pddl_registry import pddl_registry
+from planning_worker import PORTFOLIO_PLANNER, planning_portfolio, planning_pool
+from plan_cache import plan_cache
+
+
+# planner_stats: configuration and statistics of the symbolic search, for the LLM+Planner methods
+PlannerResult = namedtuple("PlannerResult", ["plan_pddl", "plan_json", "task_pddl", "planner_stats"], defaults=[None])
+# A single LLM query of a planner. create_prompt receives the outputs of the stages it depends on.
+PlanningStage = namedtuple("PlanningStage", ["name", "dependencies", "create_prompt"])
 
 class BasePlanner:
+    symbolic_planner_name = DEFAULT_SYMBOLIC_PLANNER
+    symbolic_planner_max_nodes = SYMBOLIC_PLANNER_MAX_NODES
+    symbolic_planner_max_time_sec = SYMBOLIC_PLANNER_MAX_TIME_SEC
+
     def run_planner(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl) -> PlannerResult:
+        return self.sample_plans(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples=1)[0]
+
+    async def run_planner_async(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl) -> PlannerResult:
+        return (await self.sample_plans_async(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples=1))[0]
+
+    # Sampling k plans asks the LLM for k completions of each prompt in a single request,
+    # so the prompt is only processed (and paid for) once.
+
+    def sample_plans(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples: int = 1) -> list[PlannerResult]:
+        return asyncio.run(self.sample_plans_async(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples))
+
+    async def sample_plans_async(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples: int = 1) -> list[PlannerResult]:
         raise NotImplementedError
 
     def set_context(self, context, domain_name, task_name):
@@ -23,71 +48,108 @@ class BasePlanner:
         self.task_name = task_name
 
     def set_response_model_generator(self, model_generator_name: str):
-        if model_generator_name:
-            self.model_generator = available_pydantic_generators[model_generator_name]
+        if model_generator_name and available_pydantic_generators[model_generator_name]:
+            self.model_generator_name = model_generator_name
         else:
-            self.model_generator = None
+            self.model_generator_name = None
+
+    def set_symbolic_planner(self, name: str, max_nodes: int = None, max_time_sec: float = None):
+        self.symbolic_planner_name = name
+        self.symbolic_planner_max_nodes = max_nodes
+        self.symbolic_planner_max_time_sec = max_time_sec
 
     def _load_prompt_templates(self):
         raise NotImplementedError
 
-    def _query_llm(self, prompt_text, domain_pddl = None):
-
-        @backoff.on_exception(backoff.expo, openai.RateLimitError)
-        def completions_with_backoff(**kwargs):
-            return openai_client.beta.chat.completions.parse(**kwargs)
-
-        response_format = None
-        if self.model_generator:
+    def _prepare_llm_query(self, prompt_text, domain_pddl = None, samples: int = 1):
+        response_model = None
+        if self.model_generator_name:
             if domain_pddl:
-                response_format = self.model_generator(domain_pddl).create_response_model()
+                response_model = get_response_model(self.model_generator_name, domain_pddl)
             else:
                 raise ValueError("Cannot generate Pydantic model if the pddl domain is not given")
 
-        server_cnt = 0
-        result_text = ""
-        while server_cnt < 10:
+        completions_args = {
+            'model': OPENAI_MODEL,
+            'temperature': 0.0,
+            'top_p': 1,
+            'frequency_penalty': 0,
+            'presence_penalty': 0,
+            'messages': [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt_text},
+            ]
+        }
+        if response_model:
+            completions_args['response_format'] = response_model.response_format
+        if samples > 1:
+            # identical samples would be pointless, so sampling uses a non-zero temperature
+            completions_args['n'] = samples
+            completions_args['temperature'] = LLM_SAMPLING_TEMPERATURE
+
+        cache_key = llm_request_key(completions_args, response_model.response_format_json if response_model else None)
+        return completions_args, cache_key
+
+    @staticmethod
+    def _estimate_llm_tokens(completions_args) -> int:
+        # rough count (~4 characters per token) used to reserve tokens/minute quota before sending
+        prompt_chars = sum(len(message["content"]) for message in completions_args["messages"])
+        return prompt_chars // 4 + LLM_ESTIMATED_COMPLETION_TOKENS * completions_args.get('n', 1)
+
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        # exponential backoff with full jitter, for errors other than rate limiting
+        return random.uniform(0, min(60, 2 ** attempt))
+
+    async def _query_llm_async(self, prompt_text, domain_pddl = None, samples: int = 1) -> list[str]:
+
+        completions_args, cache_key = self._prepare_llm_query(prompt_text, domain_pddl, samples)
+        trace = LlmCallTrace(completions_args['model'], samples)
+        cached_result = llm_response_cache.lookup(cache_key)
+        if cached_result is not None:
+            trace.cache_hit, trace.status = True, "ok"
+            llm_trace_writer.write(trace)
+            return cached_result
+
+        estimated_tokens = self._estimate_llm_tokens(completions_args)
+        results = [""] * samples
+        for attempt in range(LLM_MAX_RETRIES):
+            await llm_rate_limiter.acquire_async(estimated_tokens)
+            trace.start_attempt()
             try:
-                completions_args = {
-                    'model': OPENAI_MODEL,
-                    'temperature': 0.0,
-                    'top_p': 1,
-                    'frequency_penalty': 0,
-                    'presence_penalty': 0,
-                    'messages': [
-                        {"role": "system", "content": "You are a helpful assistant."},
-                        {"role": "user", "content": prompt_text},
-                    ]
-                }
-                if response_format:
-                    completions_args['response_format'] = response_format
-                response = completions_with_backoff(**completions_args)
-                result_text = response.choices[0].message.content
-                break
+                response, headers = await get_llm_backend().complete_async(completions_args, trace, cache_key)
+            except openai.RateLimitError as e:
+                trace.rate_limited += 1
+                llm_rate_limiter.release(estimated_tokens, headers=e.response.headers, rate_limited=True)
+                continue
             except Exception as e:
-                server_cnt += 1
+                llm_rate_limiter.release(estimated_tokens, error=True)
                 print(e)
-        return result_text
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            trace.usage, trace.status = response.usage, "ok"
+            used_tokens = response.usage.total_tokens if response.usage else None
+            llm_rate_limiter.release(estimated_tokens, used_tokens, headers)
+            results = [choice.message.content for choice in sorted(response.choices, key=lambda c: c.index)]
+            llm_response_cache.save(cache_key, results)
+            break
+        llm_trace_writer.write(trace)
+        return results
 
 class BaseLlmPlanner(BasePlanner):
 
-    def run_planner(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl) -> PlannerResult:
-        
-        prompt = self._create_prompt(init_nl, goal_nl, constraints_nl, domain_nl)
-        plan_json = self._query_llm(prompt, domain_pddl)
+    async def sample_plans_async(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples: int = 1) -> list[PlannerResult]:
 
-        res = PlannerResult(
-            plan_pddl=None, 
-            plan_json=plan_json,
-            task_pddl=None
-            )
+        prompt = self._create_prompt(init_nl, goal_nl, constraints_nl, domain_nl)
+        with llm_call_context(stage="plan"):
+            plans_json = await self._query_llm_async(prompt, domain_pddl, samples)
 
-        return res
+        return [PlannerResult(plan_pddl=None, plan_json=plan_json, task_pddl=None) for plan_json in plans_json]
 
     def _load_prompt_templates(self):
         if hasattr(self, 'name'):
             with open(f'prompt_templates/{self.name}.prompt', 'r') as file:
-                self.prompt_template = file.read()
+                self.prompt_template = PromptLayout(file.read())
         else:
             raise ValueError("Planner name not defined")
 
@@ -105,34 +167,100 @@ class BaseLlmPlanner(BasePlanner):
 
 class BaseLlmPddlPlanner(BasePlanner):
 
-    def run_planner(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl) -> PlannerResult:
-        
-        init_prompt = self._create_init_prompt(init_nl, domain_nl, domain_pddl)
-        init_pddl = self._query_llm(init_prompt)
-        init_pddl = init_pddl.strip("`")
-
-        goal_prompt = self._create_goal_prompt(goal_nl, init_pddl, domain_nl, domain_pddl)
-        goal_pddl = self._query_llm(goal_prompt)
-        goal_pddl = goal_pddl.strip("`")
-
-        constraints_prompt = self._create_constraints_prompt(constraints_nl, init_pddl, domain_nl, domain_pddl)
-        constraints_pddl = self._query_llm(constraints_prompt)
-        constraints_pddl = constraints_pddl.strip("`")
-
-        task_pddl = self._compose_task_pddl(init_pddl, goal_pddl, constraints_pddl)
-
-        try:
-            plan_pddl = self._run_symbolic_planner(domain_pddl, task_pddl)
-        except:
-            plan_pddl = "; symbolic planner error"
-
-        res = PlannerResult(
-            plan_pddl=plan_pddl, 
-            plan_json=None,
-            task_pddl=task_pddl
-            )
-
-        return res
+    async def sample_plans_async(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl, samples: int = 1) -> list[PlannerResult]:
+
+        stages = self._create_stages(init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl)
+        samples_outputs = await self._run_stages_async(stages, samples)
+
+        return await self._plans_from_stage_outputs(samples_outputs, domain_pddl)
+
+    def _create_stages(self, init_nl, goal_nl, constraints_nl, domain_nl, domain_pddl) -> list[PlanningStage]:
+        # goal and constraints only depend on the initial state, so they can be queried concurrently
+        return [
+            PlanningStage("init", [], 
+                lambda outputs: self._create_init_prompt(init_nl, domain_nl, domain_pddl)),
+            PlanningStage("goal", ["init"], 
+                lambda outputs: self._create_goal_prompt(goal_nl, outputs["init"], domain_nl, domain_pddl)),
+            PlanningStage("constraints", ["init"], 
+                lambda outputs: self._create_constraints_prompt(constraints_nl, outputs["init"], domain_nl, domain_pddl)),
+        ]
+
+    @staticmethod
+    def _sort_stages(stages: list[PlanningStage]) -> list[PlanningStage]:
+        stages_by_name = {stage.name: stage for stage in stages}
+        sorted_stages = []
+        visiting = set()
+        visited = set()
+
+        def visit(stage):
+            if stage.name in visited:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Cyclic dependency between planner stages involving '{stage.name}'")
+            visiting.add(stage.name)
+            for dependency in stage.dependencies:
+                if dependency not in stages_by_name:
+                    raise ValueError(f"Planner stage '{stage.name}' depends on unknown stage '{dependency}'")
+                visit(stages_by_name[dependency])
+            visiting.remove(stage.name)
+            visited.add(stage.name)
+            sorted_stages.append(stage)
+
+        for stage in stages:
+            visit(stage)
+        return sorted_stages
+
+    @staticmethod
+    def _group_samples(stage: PlanningStage, samples_outputs: list[dict]) -> list[list[int]]:
+        # samples whose dependencies produced the same outputs share one prompt, and thus one request
+        groups = {}
+        for i, outputs in enumerate(samples_outputs):
+            groups.setdefault(tuple(outputs[d] for d in stage.dependencies), []).append(i)
+        return list(groups.values())
+
+    async def _run_stages_async(self, stages: list[PlanningStage], samples: int = 1) -> list[dict]:
+        samples_outputs = [{} for _ in range(samples)]
+        stage_tasks = {}
+
+        async def run_group(stage, group):
+            prompt = stage.create_prompt(samples_outputs[group[0]])
+            with llm_call_context(stage=stage.name):
+                results = await self._query_llm_async(prompt, samples=len(group))
+            for i, result in zip(group, results):
+                samples_outputs[i][stage.name] = result.strip("`")
+
+        async def run_stage(stage):
+            await asyncio.gather(*[stage_tasks[dependency] for dependency in stage.dependencies])
+            await asyncio.gather(*[run_group(stage, group) for group in self._group_samples(stage, samples_outputs)])
+
+        # stages are scheduled in dependency order, each one starts as soon as its dependencies are done
+        for stage in self._sort_stages(stages):
+            stage_tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+        await asyncio.gather(*stage_tasks.values())
+        return samples_outputs
+
+    async def _plans_from_stage_outputs(self, samples_outputs: list[dict], domain_pddl) -> list[PlannerResult]:
+        task_pddls = [self._compose_task_pddl(stage_outputs["init"], stage_outputs["goal"], stage_outputs["constraints"])
+                      for stage_outputs in samples_outputs]
+
+        # samples often produce the same problem, which only needs to be solved once. Solving blocks
+        # until the worker answers, so it runs in a thread to keep the event loop serving the LLM requests
+        unique_task_pddls = list(dict.fromkeys(task_pddls))
+        solutions = await asyncio.gather(*[asyncio.to_thread(self._run_symbolic_planner, domain_pddl, task_pddl)
+                                           for task_pddl in unique_task_pddls])
+        plans_by_task = dict(zip(unique_task_pddls, solutions))
+
+        results = []
+        for task_pddl in task_pddls:
+            plan_pddl, planner_stats = plans_by_task[task_pddl]
+            results.append(PlannerResult(
+                plan_pddl=plan_pddl, 
+                plan_json=None,
+                task_pddl=task_pddl,
+                planner_stats=planner_stats
+                ))
+
+        return results
 
     def _compose_task_pddl(self, init_pddl, goal_pddl, constraints_pddl) -> str:
         problem_name_pddl = f"(problem {self.domain_name}-{self.task_name})"
@@ -140,30 +268,39 @@ class BaseLlmPddlPlanner(BasePlanner):
         return f"(define {problem_name_pddl} {domain_name_pddl} {init_pddl} {goal_pddl} {constraints_pddl})"
 
     def _run_symbolic_planner(self, domain_pddl_text, problem_pddl_text):
-
-        # plan
-        domain = jl.PDDL.parse_domain(domain_pddl_text)
-        problem = jl.PDDL.parse_problem(problem_pddl_text)
-        planner = jl.SymbolicPlanners.ForwardPlanner()
-        # planner = jl.SymbolicPlanners.AStarPlanner(jl.SymbolicPlanners.HAdd())
-        if jl.isnothing(jl.PDDL.get_constraints(problem)):
-            sol = planner(domain, problem)
+        # plans in the supervised worker, which bounds the time and memory a generated problem can take.
+        # Returns the plan and the search statistics.
+        is_portfolio = self.symbolic_planner_name == PORTFOLIO_PLANNER
+        cache_key = plan_cache.key(domain_pddl_text, problem_pddl_text,
+                                   planning_portfolio.name() if is_portfolio else self.symbolic_planner_name,
+                                   self.symbolic_planner_max_nodes, self.symbolic_planner_max_time_sec)
+        cached = plan_cache.lookup(cache_key)
+        if cached is not None:
+            sol_str, stats = cached
+            stats["plan_cache_hit"] = True
         else:
-            state = jl.PDDL.initstate(domain, problem)
-            spec = jl.SymbolicPlanners.StateConstrainedGoal(problem)
-            sol = planner(domain, state, spec)
-
-        sol_str = "\n".join([jl.PDDL.write_pddl(a) for a in sol])
-        return sol_str
+            if is_portfolio:
+                sol_str, stats = planning_portfolio.solve(domain_pddl_text, problem_pddl_text,
+                                                          self.symbolic_planner_max_nodes, self.symbolic_planner_max_time_sec,
+                                                          pddl_registry.compiled, pddl_registry.grounded_constraints)
+            else:
+                sol_str, stats = planning_pool.solve(domain_pddl_text, problem_pddl_text, self.symbolic_planner_name,
+                                                     self.symbolic_planner_max_nodes, self.symbolic_planner_max_time_sec,
+                                                     pddl_registry.compiled, pddl_registry.grounded_constraints)
+            plan_cache.save(cache_key, sol_str, stats)
+            stats["plan_cache_hit"] = False
+        if stats["status"] != "solved":
+            return f"; symbolic planner {stats['status']}", stats
+        return sol_str, stats
 
     def _load_prompt_templates(self):
         if hasattr(self, 'name'):
             with open(f'prompt_templates/{self.name}_init.prompt', 'r') as file:
-                self.init_prompt_template = file.read()
+                self.init_prompt_template = PromptLayout(file.read())
             with open(f'prompt_templates/{self.name}_goal.prompt', 'r') as file:
-                self.goal_prompt_template = file.read()
+                self.goal_prompt_template = PromptLayout(file.read())
             with open(f'prompt_templates/{self.name}_constraints.prompt', 'r') as file:
-                self.constraints_prompt_template = file.read()
+                self.constraints_prompt_template = PromptLayout(file.read())
         else:
             raise ValueError("Planner name not defined")
 
@@ -174,7 +311,7 @@ class LlmIcPddlPlanner(BaseLlmPddlPlanner):
         self._load_prompt_templates()
 
     def _create_init_prompt(self, init_nl, domain_nl, domain_pddl) -> str:
-        prompt = self.init_prompt_template.format(
+        prompt = self.init_prompt_template.render(
             domain_nl=domain_nl,
             context_init_nl = self.context["init_nl"],
             context_init_pddl = self.context["init_pddl"],
@@ -183,7 +320,7 @@ class LlmIcPddlPlanner(BaseLlmPddlPlanner):
         return prompt
 
     def _create_goal_prompt(self, goal_nl, init_pddl, domain_nl, domain_pddl) -> str:
-        prompt = self.goal_prompt_template.format(
+        prompt = self.goal_prompt_template.render(
             domain_nl=domain_nl,
             context_goal_nl = self.context["goal_nl"],
             context_goal_pddl = self.context["goal_pddl"],
@@ -193,7 +330,7 @@ class LlmIcPddlPlanner(BaseLlmPddlPlanner):
         return prompt
 
     def _create_constraints_prompt(self, constraints_nl, init_pddl, domain_nl, domain_pddl) -> str:
-        prompt = self.constraints_prompt_template.format(
+        prompt = self.constraints_prompt_template.render(
             domain_nl=domain_nl,
             context_constraints_nl = self.context["constraints_nl"],
             context_constraints_pddl = self.context["constraints_pddl"],
@@ -209,7 +346,7 @@ class LlmPddlPlanner(BaseLlmPddlPlanner):
         self._load_prompt_templates()
 
     def _create_init_prompt(self, init_nl, domain_nl, domain_pddl) -> str:
-        prompt = self.init_prompt_template.format(
+        prompt = self.init_prompt_template.render(
             domain_nl=domain_nl,
             domain_pddl=domain_pddl,
             init_nl=init_nl
@@ -217,7 +354,7 @@ class LlmPddlPlanner(BaseLlmPddlPlanner):
         return prompt
 
     def _create_goal_prompt(self, goal_nl, init_pddl, domain_nl, domain_pddl) -> str:
-        prompt = self.goal_prompt_template.format(
+        prompt = self.goal_prompt_template.render(
             domain_nl=domain_nl,
             domain_pddl=domain_pddl,
             init_pddl=init_pddl,
@@ -226,7 +363,7 @@ class LlmPddlPlanner(BaseLlmPddlPlanner):
         return prompt
 
     def _create_constraints_prompt(self, constraints_nl, init_pddl, domain_nl, domain_pddl) -> str:
-        prompt = self.constraints_prompt_template.format(
+        prompt = self.constraints_prompt_template.render(
             domain_nl=domain_nl,
             domain_pddl=domain_pddl,
             init_pddl=init_pddl,
@@ -241,7 +378,7 @@ class LlmPlanner(BaseLlmPlanner):
         self._load_prompt_templates()
 
     def _create_prompt(self, init_nl, goal_nl, constraints_nl, domain_nl):
-        prompt = self.prompt_template.format(
+        prompt = self.prompt_template.render(
             domain_nl=domain_nl,
             init_nl=init_nl,
             goal_nl=goal_nl,
@@ -256,7 +393,7 @@ class LlmIcPlanner(BaseLlmPlanner):
         self._load_prompt_templates()
 
     def _create_prompt(self, init_nl, goal_nl, constraints_nl, domain_nl):
-        prompt = self.prompt_template.format(
+        prompt = self.prompt_template.render(
             domain_nl=domain_nl,
             context_init_nl=self.context["init_nl"],
             context_goal_nl=self.context["goal_nl"],
@@ -0,0 +1,355 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import PLANNING_TIMEOUT_SEC, PLANNING_MAX_MEMORY_MB, PLANNING_WORKERS, SYMBOLIC_PLANNER_PORTFOLIO
+from multiprocessing.connection import Connection
+
+# Outcome of a planning request:
+# solved, unsolvable (the search space was exhausted), timeout (wall-clock limit or search budget),
+# oom (memory cap), parse-error (the problem could not be parsed or instantiated), error (anything else),
+# cancelled (another planner of a portfolio found a solution first)
+PLANNING_STATUSES = ["solved", "unsolvable", "timeout", "oom", "parse-error", "error", "cancelled"]
+
+# symbolic planner name selecting the portfolio of SYMBOLIC_PLANNER_PORTFOLIO
+PORTFOLIO_PLANNER = "portfolio"
+
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_SEARCH_STATUSES = {
+    "success": "solved",
+    "failure": "unsolvable",
+    "max_time": "timeout",
+    "max_nodes": "timeout",
+    "max_mem": "oom"
+}
+
+def _solve(request) -> tuple:
+    from julia_env import jl
+    from pddl_registry import pddl_registry
+    from symbolic_planners import run_symbolic_search
+
+    pddl_registry.compiled = request["compiled"]
+    pddl_registry.grounded_constraints = request["grounded_constraints"]
+    try:
+        domain, state = pddl_registry.semantics(request["domain_pddl"], request["problem_pddl"])
+        problem = pddl_registry.problem(request["problem_pddl"])
+        constraints = pddl_registry.constraint_checker(request["domain_pddl"], request["problem_pddl"])
+    except Exception as e:
+        return None, {"symbolic_planner": request["planner_name"], "status": "parse-error", "error": str(e)}
+
+    if constraints is None:
+        spec = jl.SymbolicPlanners.MinStepsGoal(problem)
+    else:
+        spec = jl.GroundedConstraints.constrained_goal(problem, constraints)
+    sol, stats = run_symbolic_search(request["planner_name"], domain, state, spec,
+                                     request["max_nodes"], request["max_time_sec"])
+    stats["search_status"] = stats["status"]
+    stats["status"] = _SEARCH_STATUSES.get(stats["search_status"], "error")
+    if stats["status"] != "solved":
+        return None, stats
+    return "\n".join([jl.PDDL.write_pddl(a) for a in sol]), stats
+
+def _is_interrupt(e: BaseException) -> bool:
+    from julia_env import jl
+    if isinstance(e, KeyboardInterrupt):
+        return True
+    # juliacall raises the Julia exceptions as JuliaError, which holds the original one
+    return hasattr(e, "exception") and bool(jl.isa(e.exception, jl.InterruptException))
+
+def _worker_main(fd: int, max_memory_mb: float):
+    # makes the Julia GC collect more eagerly before the supervisor's memory cap is reached
+    if max_memory_mb:
+        os.environ.setdefault("PYTHON_JULIACALL_HEAP_SIZE_HINT", f"{int(max_memory_mb * 0.8)}M")
+    # Julia handles SIGINT by throwing an InterruptException in the running search instead of
+    # exiting, so that a request can be cancelled without restarting the worker
+    os.environ.setdefault("PYTHON_JULIACALL_HANDLE_SIGNALS", "yes")
+    from julia_env import jl
+    jl.seval("Base.exit_on_sigint(false)")
+    conn = Connection(fd)
+    conn.send("ready")
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        except KeyboardInterrupt:
+            # an interrupt sent just after the previous request was answered
+            continue
+        try:
+            result = _solve(request)
+        except BaseException as e:
+            if _is_interrupt(e):
+                result = (None, {"symbolic_planner": request["planner_name"], "status": "cancelled", "error": "interrupted"})
+            elif isinstance(e, Exception):
+                result = (None, {"symbolic_planner": request["planner_name"], "status": "error", "error": str(e)})
+            else:
+                raise
+        conn.send(result)
+
+class PlanningWorker:
+    """Runs the symbolic planner in a separate process, under a wall-clock limit and a memory cap.
+
+    The worker is started on first use and reused across requests. When a request exceeds
+    a limit the worker is killed, the request gets the "timeout" or "oom" status, and a new
+    worker is started for the next request. A cancelled request is interrupted with SIGINT
+    instead, which keeps the worker and its compiled Julia code alive.
+    """
+
+    POLL_INTERVAL_SEC = 0.05
+    # time given to an interrupted search to unwind before the worker is killed
+    INTERRUPT_GRACE_SEC = 5.0
+
+    def __init__(self, timeout_sec: float = PLANNING_TIMEOUT_SEC, max_memory_mb: float = PLANNING_MAX_MEMORY_MB):
+        self.timeout_sec = timeout_sec
+        self.max_memory_mb = max_memory_mb
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Julia does not survive a fork, and multiprocessing's spawn would re-import the main
+        # script with all its dependencies, so the worker is a fresh interpreter that only loads this module
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_MODULE_DIR, os.environ.get("PYTHONPATH")])))
+        self._process = subprocess.Popen(
+            [sys.executable, "-c", "import sys, planning_worker; planning_worker._worker_main(int(sys.argv[1]), float(sys.argv[2]))",
+             str(child_sock.fileno()), str(self.max_memory_mb or 0)],
+            pass_fds=[child_sock.fileno()], env=env)
+        child_sock.close()
+        self._conn = Connection(parent_sock.detach())
+        # the limits only apply once Julia is loaded
+        try:
+            ready = self._conn.recv()
+        except (EOFError, OSError):
+            ready = None
+        if ready != "ready":
+            _, error = self._exit_failure()
+            self.stop()
+            raise RuntimeError(f"The planning worker failed to start: {error}")
+
+    def _exit_failure(self) -> tuple:
+        # status and message of a worker that exited on its own
+        try:
+            returncode = self._process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            return "error", "lost the connection to the planning worker"
+        if returncode == -signal.SIGKILL:
+            # nothing here kills the worker without stopping it first, so it was most likely the kernel OOM killer
+            return "oom", "planning worker was killed by the system"
+        return "error", f"planning worker exited with code {returncode}"
+
+    def stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def _rss_mb(self) -> float:
+        try:
+            return psutil.Process(self._process.pid).memory_info().rss / (1024 * 1024)
+        except psutil.NoSuchProcess:
+            return 0.0
+
+    def solve(self, domain_pddl: str, problem_pddl: str, planner_name: str,
+                    max_nodes: int = None, max_time_sec: float = None, compiled: bool = False,
+                    grounded_constraints: bool = False, cancel_event: threading.Event = None) -> tuple:
+        """Return the plan (None when not solved) and the search statistics, whose "status" is one of PLANNING_STATUSES.
+        Setting cancel_event interrupts the search and ends the request with the "cancelled" status."""
+        request = {
+            "domain_pddl": domain_pddl,
+            "problem_pddl": problem_pddl,
+            "planner_name": planner_name,
+            "max_nodes": max_nodes,
+            "max_time_sec": max_time_sec,
+            "compiled": compiled,
+            "grounded_constraints": grounded_constraints
+        }
+        with self._lock:
+            start = time.monotonic()
+            # a late interrupt can hit the request after the one it was sent for, which is then run again
+            for attempt in range(2):
+                plan_pddl, stats, interrupted, peak_rss_mb = self._run_request(request, cancel_event)
+                if stats["status"] != "cancelled" or interrupted:
+                    break
+            stats["wall_time_sec"] = time.monotonic() - start
+            stats["peak_rss_mb"] = peak_rss_mb
+            return plan_pddl, stats
+
+    def _run_request(self, request: dict, cancel_event: threading.Event) -> tuple:
+        # returns the plan, the statistics, whether the request was interrupted, and the peak memory usage
+        if cancel_event is not None and cancel_event.is_set():
+            stats = {"symbolic_planner": request["planner_name"], "status": "cancelled", "error": "another planner found a solution first"}
+            return None, stats, True, 0.0
+        if self._process is None or self._process.poll() is not None:
+            self.stop()
+            try:
+                self._start()
+            except RuntimeError as e:
+                return None, {"symbolic_planner": request["planner_name"], "status": "error", "error": str(e)}, False, 0.0
+
+        peak_rss_mb = self._rss_mb()
+        failure = None
+        interrupted_at = None
+        try:
+            self._conn.send(request)
+        except OSError:
+            failure = self._exit_failure()
+            self.stop()
+        # the wall-clock limit only covers the request, not the start of the worker
+        start = time.monotonic()
+        while failure is None and not self._conn.poll(self.POLL_INTERVAL_SEC):
+            peak_rss_mb = max(peak_rss_mb, self._rss_mb())
+            if cancel_event is not None and cancel_event.is_set() and interrupted_at is None:
+                interrupted_at = time.monotonic()
+                self._process.send_signal(signal.SIGINT)
+            elif interrupted_at is not None and time.monotonic() - interrupted_at > self.INTERRUPT_GRACE_SEC:
+                failure = ("cancelled", "another planner found a solution first")
+            elif self._process.poll() is not None:
+                failure = self._exit_failure()
+            elif self.max_memory_mb and peak_rss_mb > self.max_memory_mb:
+                failure = ("oom", f"planning worker exceeded {self.max_memory_mb} MB")
+            elif self.timeout_sec and time.monotonic() - start > self.timeout_sec:
+                failure = ("timeout", f"planning exceeded {self.timeout_sec} sec")
+            if failure is not None:
+                self.stop()
+                break
+
+        if failure is None:
+            try:
+                plan_pddl, stats = self._conn.recv()
+            except (EOFError, OSError):
+                # the worker died between two polls, e.g. killed by the kernel or after a crash of Julia
+                failure = self._exit_failure()
+                self.stop()
+        if failure is not None:
+            plan_pddl, stats = None, {"symbolic_planner": request["planner_name"], "status": failure[0], "error": failure[1]}
+        if interrupted_at is not None and stats["status"] == "cancelled":
+            stats["error"] = "another planner found a solution first"
+        return plan_pddl, stats, interrupted_at is not None, peak_rss_mb
+
+class PlanningWorkerPool:
+    """Solves several problems at once, each one in a PlanningWorker.
+
+    Workers are started on demand, up to `size`, and reused across requests. A request
+    waits for an idle worker when they are all busy.
+    """
+
+    def __init__(self, size: int = PLANNING_WORKERS,
+                       timeout_sec: float = PLANNING_TIMEOUT_SEC, max_memory_mb: float = PLANNING_MAX_MEMORY_MB):
+        self.size = size
+        self.timeout_sec = timeout_sec
+        self.max_memory_mb = max_memory_mb
+        self._idle = []
+        self._started = 0
+        self._condition = threading.Condition()
+
+    def _acquire(self) -> PlanningWorker:
+        with self._condition:
+            while not self._idle and self._started >= self.size:
+                self._condition.wait()
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                worker = PlanningWorker()
+                self._started += 1
+        # the limits can be changed after the workers were started
+        worker.timeout_sec = self.timeout_sec
+        worker.max_memory_mb = self.max_memory_mb
+        return worker
+
+    def _release(self, worker: PlanningWorker):
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def solve(self, *args, **kwargs) -> tuple:
+        """Same as PlanningWorker.solve, on the first idle worker."""
+        worker = self._acquire()
+        try:
+            return worker.solve(*args, **kwargs)
+        finally:
+            self._release(worker)
+
+class PlanningPortfolio:
+    """Runs several symbolic planner configurations in parallel workers and keeps the first solution.
+
+    No configuration is the fastest on every problem: the blind search wins on trivial
+    problems and the heuristic ones on deep problems. As soon as one configuration solves
+    the problem, the searches of the others are interrupted, and their workers are kept for
+    the next problem. The memory cap applies to the whole portfolio, each worker gets an
+    equal share of it.
+    """
+
+    # when no configuration solves the problem, the most informative outcome is reported
+    _FAILURE_PRECEDENCE = ["parse-error", "unsolvable", "timeout", "oom", "error", "cancelled"]
+
+    def __init__(self, planner_names: list[str] = SYMBOLIC_PLANNER_PORTFOLIO,
+                       timeout_sec: float = PLANNING_TIMEOUT_SEC, max_memory_mb: float = PLANNING_MAX_MEMORY_MB):
+        self.planner_names = planner_names
+        self.timeout_sec = timeout_sec
+        self.max_memory_mb = max_memory_mb
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def name(self) -> str:
+        return f"{PORTFOLIO_PLANNER}({','.join(self.planner_names)})"
+
+    def _worker(self, planner_name: str) -> PlanningWorker:
+        # problems of concurrent tasks share the worker of each configuration, and wait for it
+        with self._lock:
+            if planner_name not in self._workers:
+                self._workers[planner_name] = PlanningWorker()
+            worker = self._workers[planner_name]
+        worker.timeout_sec = self.timeout_sec
+        worker.max_memory_mb = self.max_memory_mb / len(self.planner_names) if self.max_memory_mb else None
+        return worker
+
+    def solve(self, domain_pddl: str, problem_pddl: str,
+                    max_nodes: int = None, max_time_sec: float = None, compiled: bool = False,
+                    grounded_constraints: bool = False) -> tuple:
+        """Return the first plan found and its search statistics, with the outcome of every configuration under "portfolio"."""
+        cancel_event = threading.Event()
+        results = {}
+        winner = None
+        pool = ThreadPoolExecutor(max_workers=len(self.planner_names))
+        try:
+            futures = {
+                pool.submit(self._worker(name).solve, domain_pddl, problem_pddl, name, max_nodes, max_time_sec,
+                            compiled, grounded_constraints, cancel_event): name
+                for name in self.planner_names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                if results[name][1]["status"] == "solved":
+                    winner = name
+                    cancel_event.set()
+                    break
+        finally:
+            # the other configurations are not waited for: they unwind in the background, or return
+            # right away when their worker is still busy with another problem
+            pool.shutdown(wait=False)
+
+        if winner is not None:
+            plan_pddl, stats = results[winner]
+            print(f"[info] portfolio: {winner} solved the problem first in {stats['wall_time_sec']:.2f} sec")
+        else:
+            best = min(results, key=lambda name: self._FAILURE_PRECEDENCE.index(results[name][1]["status"]))
+            plan_pddl, stats = results[best]
+        stats = {**stats, "portfolio_winner": winner,
+                 "portfolio": {name: results[name][1]["status"] if name in results else "cancelled" for name in self.planner_names}}
+        return plan_pddl, stats
+
+planning_pool = PlanningWorkerPool()
+planning_portfolio = PlanningPortfolio()
@@ -0,0 +1,50 @@
+import re
+
+from string import Formatter
+
+def is_static_field(field: str) -> bool:
+    # the domain and the in-context example are the same for every task of a domain
+    return field.startswith("domain_") or field.startswith("context_")
+
+class PromptLayout:
+    """Prompt template whose sections are reordered so that the task-independent ones come first.
+
+    The template is split into blank-line separated sections. A section without
+    placeholders (e.g. a bare heading) belongs with the section that follows it.
+    Sections that only use static fields (the domain and the in-context example)
+    are emitted first, in template order, followed by the remaining ones in
+    template order. The trailing sections without placeholders (e.g. the
+    instructions) thus stay at the end, after the task. Prompts of the same
+    template then share a stable prefix, which lets the LLM provider reuse its
+    prompt cache across tasks and perturbations.
+    """
+
+    def __init__(self, template: str):
+        sections = [s.strip("\n") for s in re.split(r"\n[ \t]*\n", template.strip()) if s.strip()]
+
+        groups = []
+        pending = []
+        for section in sections:
+            pending.append(section)
+            if self._fields(section):
+                groups.append(pending)
+                pending = []
+        groups.extend([s] for s in pending)
+
+        static_groups, dynamic_groups = [], []
+        for group in groups:
+            fields = set().union(*[self._fields(s) for s in group])
+            # groups without any field are the trailing sections, which are kept after the task
+            target = static_groups if fields and all(is_static_field(f) for f in fields) else dynamic_groups
+            target.append("\n\n".join(group))
+
+        self.static_template = "\n\n".join(static_groups)
+        self.dynamic_template = "\n\n".join(dynamic_groups)
+
+    @staticmethod
+    def _fields(section: str) -> set:
+        return {field for _, field, _, _ in Formatter().parse(section) if field}
+
+    def render(self, **fields) -> str:
+        parts = [self.static_template.format(**fields), self.dynamic_template.format(**fields)]
+        return "\n\n".join(p for p in parts if p)
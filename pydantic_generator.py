@@ -1,13 +1,18 @@
-from juliacall import Main as jl
+import hashlib
+import json
+import threading
+
+from collections import namedtuple
+from julia_env import jl
+from pddl_registry import pddl_registry
+from openai.lib._parsing._completions import type_to_response_format_param
 from typing import Union, Literal
 from pydantic import BaseModel, create_model
 
-# Initialize Julia and load PDDL package
-jl.seval('using PDDL')
 
 class BasePydanticModelGenerator:
     def __init__(self, domain_pddl: str):
-        self.domain = jl.PDDL.parse_domain(domain_pddl)
+        self.domain = pddl_registry.domain(domain_pddl)
 
     # Function to generate Pydantic models from domain actions
     def _generate_step_models(self) -> list:
@@ -67,4 +72,25 @@ available_pydantic_generators = {
     "strict_actions": StrictActionsPydModelGen,
     "sentence_actions": SentenceActionsPydModelGen,
     "none": None
-}
\ No newline at end of file
+}
+
+# model: the generated Pydantic class
+# response_format: the `response_format` request parameter, with the strict JSON schema of the model
+# response_format_json: response_format serialized once, used to key cached LLM responses
+ResponseModelEntry = namedtuple("ResponseModelEntry", ["model", "response_format", "response_format_json"])
+
+_response_model_registry = {}
+_response_model_registry_lock = threading.Lock()
+
+def get_response_model(generator_name: str, domain_pddl: str) -> ResponseModelEntry:
+    """Return the response model of a generator for a domain, building it only the first time."""
+    domain_hash = hashlib.sha256(domain_pddl.encode("utf-8")).hexdigest()
+    key = (generator_name, domain_hash)
+    with _response_model_registry_lock:
+        if key not in _response_model_registry:
+            model_generator = available_pydantic_generators[generator_name]
+            model = model_generator(domain_pddl).create_response_model()
+            response_format = type_to_response_format_param(model)
+            response_format_json = json.dumps(response_format, sort_keys=True, separators=(",", ":"))
+            _response_model_registry[key] = ResponseModelEntry(model, response_format, response_format_json)
+        return _response_model_registry[key]
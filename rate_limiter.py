@@ -0,0 +1,163 @@
+import asyncio
+import random
+import re
+import threading
+import time
+
+from config import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_CONCURRENCY
+
+def parse_reset_duration(value: str) -> float:
+    # OpenAI reports reset times as durations such as "1s", "6m0s" or "20ms"
+    if value is None:
+        return None
+    seconds = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+def _header_float(headers, name):
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.set_rate(per_minute)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def set_rate(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_sec = per_minute / 60.0
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_sec)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        # a request larger than the whole bucket only waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.refill_per_sec)
+
+class RateLimiter:
+    """Shared client-side limiter for the LLM API.
+
+    Requests and tokens per minute are enforced with token buckets that are kept
+    in sync with the rate limit headers of the responses. The number of requests
+    in flight is adapted AIMD-style: it grows by one per window of successful
+    requests and is halved on a 429 or when the server reports the quota is
+    almost exhausted. It is safe to use from several threads and async tasks.
+    """
+
+    # fraction of the quota kept in reserve before the limiter starts backing off
+    SAFETY_MARGIN = 0.05
+    # minimum time between two multiplicative decreases
+    DECREASE_COOLDOWN_SEC = 1.0
+    # upper bound of a single sleep while waiting for capacity
+    MAX_POLL_SEC = 0.5
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_concurrency: int, min_concurrency: int = 1):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    def set_max_concurrency(self, max_concurrency: int):
+        with self._lock:
+            self.max_concurrency = max_concurrency
+            self.concurrency_limit = float(max_concurrency)
+
+    def _try_acquire(self, estimated_tokens: int) -> float:
+        # returns 0 when a slot was taken, otherwise the time to wait before trying again
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= max(self.min_concurrency, int(self.concurrency_limit)):
+                return 0.05
+            wait = max(self.requests.time_until(1), self.tokens.time_until(estimated_tokens))
+            if wait > 0:
+                return wait
+            self.requests.level -= 1
+            self.tokens.level -= estimated_tokens
+            self.in_flight += 1
+            return 0.0
+
+    def _sleep_time(self, wait: float) -> float:
+        # jitter keeps waiting clients from waking up in lockstep
+        return min(wait, self.MAX_POLL_SEC) * random.uniform(1.0, 1.2)
+
+    def acquire(self, estimated_tokens: int):
+        while (wait := self._try_acquire(estimated_tokens)) > 0:
+            time.sleep(self._sleep_time(wait))
+
+    async def acquire_async(self, estimated_tokens: int):
+        while (wait := self._try_acquire(estimated_tokens)) > 0:
+            await asyncio.sleep(self._sleep_time(wait))
+
+    def release(self, estimated_tokens: int, used_tokens: int = None, headers = None, rate_limited: bool = False, error: bool = False):
+        # error: the request failed for another reason than rate limiting, which says nothing about the spare capacity
+        with self._lock:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if used_tokens is not None:
+                # give back (or take) the difference between the estimate and the actual usage
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - used_tokens)
+
+            near_quota = self._sync_with_headers(headers, now)
+
+            if rate_limited:
+                retry_after = self._retry_after(headers)
+                self._paused_until = max(self._paused_until, now + retry_after)
+                self._decrease(now, force=True)
+            elif near_quota:
+                self._decrease(now)
+            elif not error:
+                # additive increase: +1 slot once every `concurrency_limit` successful requests
+                self.concurrency_limit = min(float(self.max_concurrency), self.concurrency_limit + 1.0 / self.concurrency_limit)
+
+    def _decrease(self, now: float, force: bool = False):
+        if force or now - self._last_decrease >= self.DECREASE_COOLDOWN_SEC:
+            self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+            self._last_decrease = now
+
+    def _retry_after(self, headers) -> float:
+        retry_after_ms = _header_float(headers, "retry-after-ms")
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000
+        retry_after = _header_float(headers, "retry-after")
+        if retry_after is not None:
+            return retry_after
+        return 1.0
+
+    def _sync_with_headers(self, headers, now: float) -> bool:
+        if headers is None:
+            return False
+        near_quota = False
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _header_float(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _header_float(headers, f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if limit is not None and limit > 0 and limit != bucket.capacity:
+                bucket.set_rate(limit)
+            if remaining is None:
+                continue
+            bucket.level = min(bucket.level, remaining)
+            if remaining <= bucket.capacity * self.SAFETY_MARGIN:
+                near_quota = True
+                if remaining <= 0 and reset is not None:
+                    self._paused_until = max(self._paused_until, now + reset)
+        return near_quota
+
+llm_rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_CONCURRENCY)
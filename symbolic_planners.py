@@ -0,0 +1,63 @@
+import time
+
+from collections import namedtuple
+from julia_env import jl
+
+# search: "forward" (SymbolicPlanners.ForwardPlanner), "astar", "gbfs" or "weighted_astar"
+# heuristic: a key of available_heuristics, None for the blind forward search
+# weight: weight of the heuristic, only used by weighted A*
+SymbolicPlannerConfig = namedtuple("SymbolicPlannerConfig", ["search", "heuristic", "weight"], defaults=[None, None])
+
+available_heuristics = {
+    "hadd": "HAdd",
+    "hmax": "HMax",
+    "ff": "FFHeuristic",
+    "goal_count": "GoalCountHeuristic"
+}
+
+available_symbolic_planners = {
+    "forward": SymbolicPlannerConfig("forward"),
+    **{f"astar_{h}": SymbolicPlannerConfig("astar", h) for h in available_heuristics},
+    **{f"gbfs_{h}": SymbolicPlannerConfig("gbfs", h) for h in available_heuristics},
+    **{f"wastar_{h}": SymbolicPlannerConfig("weighted_astar", h, 2.0) for h in available_heuristics}
+}
+
+def build_symbolic_planner(name: str, max_nodes: int = None, max_time_sec: float = None):
+    config = available_symbolic_planners[name]
+    budget = {}
+    if max_nodes is not None:
+        budget["max_nodes"] = max_nodes
+    if max_time_sec is not None:
+        budget["max_time"] = float(max_time_sec)
+
+    heuristic = getattr(jl.SymbolicPlanners, available_heuristics[config.heuristic])() if config.heuristic else None
+    if config.search == "forward":
+        return jl.SymbolicPlanners.ForwardPlanner(**budget) if heuristic is None \
+            else jl.SymbolicPlanners.ForwardPlanner(heuristic=heuristic, **budget)
+    elif config.search == "astar":
+        return jl.SymbolicPlanners.AStarPlanner(heuristic, **budget)
+    elif config.search == "gbfs":
+        return jl.SymbolicPlanners.GreedyPlanner(heuristic, **budget)
+    elif config.search == "weighted_astar":
+        return jl.SymbolicPlanners.WeightedAStarPlanner(heuristic, config.weight, **budget)
+    else:
+        raise ValueError(f"Unknown search algorithm {config.search}")
+
+def run_symbolic_search(name: str, domain, state, spec, max_nodes: int = None, max_time_sec: float = None) -> tuple:
+    """Solve spec from state, returning the solution and the search statistics."""
+    planner = build_symbolic_planner(name, max_nodes, max_time_sec)
+    start = time.perf_counter()
+    sol = planner(domain, state, spec)
+    time_sec = time.perf_counter() - start
+
+    status = str(sol.status)
+    stats = {
+        "symbolic_planner": name,
+        "max_nodes": max_nodes,
+        "max_time_sec": max_time_sec,
+        "status": status,
+        "expanded": int(sol.expanded) if jl.hasproperty(sol, jl.Symbol("expanded")) else None,
+        "time_sec": time_sec,
+        "plan_length": len(sol.plan) if status == "success" else None
+    }
+    return sol, stats
@@ -0,0 +1,112 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from config import LLM_PRICING
+
+# Identifies what an LLM call is made for (planner, stage, task, perturbation...).
+# Being a context variable, it follows each asyncio task and thread separately.
+_llm_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+@contextmanager
+def llm_call_context(**fields):
+    token = _llm_call_context.set({**_llm_call_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _llm_call_context.reset(token)
+
+def get_llm_call_context() -> dict:
+    return dict(_llm_call_context.get())
+
+def usage_tokens(usage) -> tuple:
+    # returns (prompt_tokens, cached_tokens, completion_tokens)
+    if usage is None:
+        return None, None, None
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        cached_tokens = details.get("cached_tokens")
+    else:
+        cached_tokens = getattr(details, "cached_tokens", None)
+    return usage.prompt_tokens, cached_tokens or 0, usage.completion_tokens
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    if model not in LLM_PRICING or prompt_tokens is None:
+        return None
+    input_price, cached_input_price, output_price = LLM_PRICING[model]
+    cached_tokens = cached_tokens or 0
+    cost = (prompt_tokens - cached_tokens) * input_price \
+         + cached_tokens * cached_input_price \
+         + (completion_tokens or 0) * output_price
+    return cost / 1_000_000
+
+class LlmCallTrace:
+    """Timing and usage of a single logical LLM call, across all its retries."""
+
+    def __init__(self, model: str, samples: int = 1):
+        self.model = model
+        self.samples = samples
+        self.context = get_llm_call_context()
+        self.start = time.monotonic()
+        self.attempts = 0
+        self.rate_limited = 0
+        self.ttfb_sec = None
+        self.usage = None
+        self.cache_hit = False
+        self.status = "failed"
+
+    def start_attempt(self):
+        self.attempts += 1
+        self.attempt_start = time.monotonic()
+
+    def first_byte(self):
+        self.ttfb_sec = time.monotonic() - self.attempt_start
+
+    def record(self) -> dict:
+        prompt_tokens, cached_tokens, completion_tokens = usage_tokens(self.usage)
+        return {
+            "timestamp": time.time(),
+            **self.context,
+            "model": self.model,
+            "samples": self.samples,
+            "status": self.status,
+            "cache_hit": self.cache_hit,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_token_ratio": cached_tokens / prompt_tokens if prompt_tokens else None,
+            "ttfb_sec": self.ttfb_sec,
+            "latency_sec": time.monotonic() - self.start,
+            "retries": max(0, self.attempts - 1),
+            "rate_limited": self.rate_limited,
+            "estimated_cost_usd": estimate_cost(self.model, prompt_tokens, cached_tokens, completion_tokens)
+        }
+
+class LlmTraceWriter:
+    def __init__(self):
+        self.path = None
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def open(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+
+    def write(self, trace: LlmCallTrace):
+        record = trace.record()
+        with self._lock:
+            self.prompt_tokens += record["prompt_tokens"] or 0
+            self.cached_tokens += record["cached_tokens"] or 0
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def cached_token_ratio(self) -> float:
+        # share of the prompt tokens sent to the API that were served from the provider prompt cache
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else None
+
+llm_trace_writer = LlmTraceWriter()
@@ -0,0 +1,88 @@
+import json
+import time
+import argparse
+
+from domains import available_domains
+from julia_env import jl
+from pddl_registry import ParsedPddlRegistry
+
+def time_call(fn, repeats):
+    """Mean duration in seconds of fn, after a warm-up call that absorbs the JIT compilation."""
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return result, (time.perf_counter() - start) / repeats
+
+def benchmark_task(domain_pddl, problem_pddl, compiled, repeats):
+    registry = ParsedPddlRegistry(compiled=compiled)
+    start = time.perf_counter()
+    domain, state = registry.semantics(domain_pddl, problem_pddl)
+    setup_sec = time.perf_counter() - start
+
+    problem = registry.problem(problem_pddl)
+    if jl.isnothing(jl.PDDL.get_constraints(problem)):
+        spec = jl.SymbolicPlanners.MinStepsGoal(problem)
+    else:
+        spec = jl.SymbolicPlanners.StateConstrainedGoal(problem)
+    planner = jl.SymbolicPlanners.ForwardPlanner()
+    sol, planning_sec = time_call(lambda: planner(domain, state, spec), repeats)
+    plan = list(sol)
+
+    def simulate():
+        trajectory = jl.SymbolicPlanners.StateRecorder(max_steps=len(plan))(jl.OrderedPlan(jl.Vector(plan)), domain, state)
+        return jl.PDDL.satisfy(domain, trajectory[-1], jl.PDDL.get_goal(problem))
+    goal_reached, simulation_sec = time_call(simulate, repeats)
+
+    # the loop of the greedy action matcher
+    def match():
+        current_state = state
+        for act in plan:
+            list(jl.PDDL.available(domain, current_state))
+            current_state = jl.PDDL.execute(domain, current_state, act)
+    _, matching_sec = time_call(match, repeats)
+
+    return {
+        "plan_length": len(plan),
+        "goal_reached": bool(goal_reached),
+        "setup_sec": setup_sec,
+        "planning_sec": planning_sec,
+        "simulation_sec": simulation_sec,
+        "matching_sec": matching_sec
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the interpreted and compiled PDDL.jl semantics on the tasks of a domain.")
+    parser.add_argument("--domain", type=str, choices=available_domains.keys(), default="manipulation")
+    parser.add_argument("--tasks", type=int, nargs="+", default=None, help="Task numbers, all tasks by default.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, default=None, help="JSON file the results are written to.")
+    args = parser.parse_args()
+
+    domain = available_domains[args.domain]
+    domain_pddl = domain.get_domain_pddl()
+    tasks = args.tasks or range(1, len(domain.tasks) + 1)
+
+    results = []
+    for task in tasks:
+        problem_pddl = domain.get_task_pddl(task)
+        for compiled in (False, True):
+            row = {"task": domain.get_task_name(task), "compiled": compiled}
+            row.update(benchmark_task(domain_pddl, problem_pddl, compiled, args.repeats))
+            results.append(row)
+            print(row)
+            if not row["goal_reached"]:
+                print(f"[info] warning: the {'compiled' if compiled else 'interpreted'} plan of {row['task']} does not reach the goal")
+
+    for compiled in (False, True):
+        rows = [r for r in results if r["compiled"] == compiled]
+        totals = {k: sum(r[k] for r in rows) for k in ("setup_sec", "planning_sec", "simulation_sec", "matching_sec")}
+        print(f"[info] {'compiled' if compiled else 'interpreted'}: {totals}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+        print(f"[info] benchmark results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
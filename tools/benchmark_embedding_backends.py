@@ -0,0 +1,93 @@
+import json
+import time
+import argparse
+
+import numpy as np
+import psutil
+
+from domains import available_domains
+from embedding_backends import available_embedding_backends
+from pddl_utils import parse_sexpr, problem_sections, write_sexpr
+
+def benchmark_texts(domain, tasks) -> list[str]:
+    """Sentences of the task descriptions and ground actions of the domain, as embedded by the plan matchers."""
+    texts = []
+    domain_pddl = parse_sexpr(domain.get_domain_pddl())
+    action_names = [expr[1] for expr in domain_pddl if isinstance(expr, list) and expr and expr[0].lower() == ":action"]
+    for task in tasks:
+        for nl in (domain.get_task_init_nl(task), domain.get_task_goal_nl(task), domain.get_task_constraints_nl(task)):
+            texts.extend(line.strip() for line in nl.splitlines() if line.strip())
+        sections = problem_sections(domain.get_task_pddl(task))
+        objects = [o for o in sections.get(":objects", [])[1:] if o != "-"]
+        texts.extend(f"{action} {obj}" for action in action_names for obj in objects)
+        texts.extend(write_sexpr(atom)[1:-1] for atom in sections.get(":init", [])[1:])
+    return list(dict.fromkeys(texts))
+
+def benchmark_backend(name, texts, repeats):
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    backend = available_embedding_backends[name]()
+    start = time.perf_counter()
+    backend.encode(texts[:1])
+    load_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embeddings = backend.encode(texts)
+    encode_sec = (time.perf_counter() - start) / repeats
+    return embeddings, {
+        "backend": name,
+        "load_sec": load_sec,
+        "encode_sec": encode_sec,
+        "texts_per_sec": len(texts) / encode_sec,
+        "rss_delta_mb": (process.memory_info().rss - rss_before) / (1024 * 1024)
+    }
+
+def agreement(embeddings, reference):
+    """Mean cosine similarity to the reference embeddings, and share of texts whose nearest other text is unchanged."""
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    similarities, reference_similarities = embeddings @ embeddings.T, reference @ reference.T
+    np.fill_diagonal(similarities, -np.inf)
+    np.fill_diagonal(reference_similarities, -np.inf)
+    return {
+        "mean_cosine_to_reference": float(np.mean(np.sum(embeddings * reference, axis=1))),
+        "top1_agreement": float(np.mean(similarities.argmax(axis=1) == reference_similarities.argmax(axis=1)))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sentence-embedding backends of the plan matchers on the texts of a domain.")
+    parser.add_argument("--domain", type=str, choices=available_domains.keys(), default="manipulation")
+    parser.add_argument("--tasks", type=int, nargs="+", default=None, help="Task numbers, all tasks by default.")
+    parser.add_argument("--backends", type=str, nargs="+", choices=available_embedding_backends.keys(), default=list(available_embedding_backends))
+    parser.add_argument("--reference", type=str, choices=available_embedding_backends.keys(), default="torch",
+                        help="Backend the embeddings of the others are compared to.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=str, default=None, help="JSON file the results are written to.")
+    args = parser.parse_args()
+
+    domain = available_domains[args.domain]
+    texts = benchmark_texts(domain, args.tasks or range(1, len(domain.tasks) + 1))
+    print(f"[info] {len(texts)} texts")
+
+    # each backend is measured in the same process, so the RSS delta of the later ones can be underestimated
+    # when they share libraries with the earlier ones; run one backend at a time for exact memory figures
+    reference, _ = benchmark_backend(args.reference, texts, 1)
+    results = []
+    for name in args.backends:
+        try:
+            embeddings, row = benchmark_backend(name, texts, args.repeats)
+        except ImportError as e:
+            print(f"[info] skipping the {name} backend: {e}")
+            continue
+        row.update(agreement(embeddings, reference))
+        results.append(row)
+        print(row)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+        print(f"[info] benchmark results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import json
+import argparse
+import subprocess
+
+import juliapkg
+
+from config import JULIA_SYSIMAGE_PATH
+
+# The system image contains the packages of the juliacall project (PDDL, SymbolicPlanners and PythonCall).
+# PackageCompiler is installed in a separate tooling environment so that the juliacall project is left unchanged.
+SYSIMAGE_PACKAGES = ["PDDL", "SymbolicPlanners", "PythonCall"]
+
+BUILD_SCRIPT = """
+using PackageCompiler
+create_sysimage({packages}; sysimage_path={sysimage_path}, precompile_execution_file={workload})
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Julia system image with PDDL.jl and SymbolicPlanners.jl precompiled.")
+    parser.add_argument("--output", type=str, default=JULIA_SYSIMAGE_PATH, help="Path of the system image.")
+    parser.add_argument("--workload", type=str, default="./julia/precompile_workload.jl",
+                        help="Julia script run during the build to record the calls to precompile.")
+    args = parser.parse_args()
+
+    # resolves the juliacall project, installing Julia and the packages if needed
+    juliapkg.resolve()
+    julia = juliapkg.executable()
+    project = juliapkg.project()
+
+    output = os.path.abspath(args.output)
+    tooling_env = os.path.join(os.path.dirname(output), "tooling")
+    os.makedirs(tooling_env, exist_ok=True)
+    subprocess.run([julia, f"--project={tooling_env}", "-e", 'using Pkg; Pkg.add("PackageCompiler")'], check=True)
+
+    # JSON literals are valid Julia literals for lists of strings and strings
+    script = BUILD_SCRIPT.format(packages=json.dumps(SYSIMAGE_PACKAGES),
+                                 sysimage_path=json.dumps(output),
+                                 workload=json.dumps(os.path.abspath(args.workload)))
+    env = dict(os.environ, JULIA_LOAD_PATH=os.pathsep.join(["@", tooling_env, "@stdlib"]))
+    print("[info] Building the Julia system image, this takes several minutes")
+    subprocess.run([julia, f"--project={project}", "-e", script], check=True, env=env)
+    print(f"[info] Julia system image written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import json
+import argparse
+
+from collections import defaultdict
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[rank]
+
+def load_trace(trace_file):
+    """Load the records of an llm_trace.jsonl file."""
+    records = []
+    with open(trace_file, 'r') as file:
+        for line in file:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+def summarize_records(records, group_by):
+    """Aggregate calls, tokens, latency and cost per group."""
+    groups = defaultdict(list)
+    for record in records:
+        groups[tuple(record.get(key) for key in group_by)].append(record)
+
+    summary = []
+    for group_key, group_records in sorted(groups.items(), key=lambda item: str(item[0])):
+        api_records = [r for r in group_records if not r["cache_hit"]]
+        latencies = [r["latency_sec"] for r in api_records]
+        ttfbs = [r["ttfb_sec"] for r in api_records if r["ttfb_sec"] is not None]
+        row = dict(zip(group_by, group_key))
+        row.update({
+            "calls": len(group_records),
+            "cache_hits": len(group_records) - len(api_records),
+            "failed": sum(1 for r in group_records if r["status"] != "ok"),
+            "retries": sum(r["retries"] for r in group_records),
+            "rate_limited": sum(r["rate_limited"] for r in group_records),
+            "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in api_records),
+            "cached_tokens": sum(r["cached_tokens"] or 0 for r in api_records),
+            "cached_token_ratio": None,
+            "completion_tokens": sum(r["completion_tokens"] or 0 for r in api_records),
+            "latency_mean_sec": sum(latencies) / len(latencies) if latencies else None,
+            "latency_p95_sec": percentile(latencies, 95),
+            "ttfb_mean_sec": sum(ttfbs) / len(ttfbs) if ttfbs else None,
+            "estimated_cost_usd": sum(r["estimated_cost_usd"] or 0 for r in api_records)
+        })
+        if row["prompt_tokens"]:
+            row["cached_token_ratio"] = row["cached_tokens"] / row["prompt_tokens"]
+        summary.append(row)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the LLM call trace of an experiment run.")
+    parser.add_argument("run_dir", type=str, help="Path to the run directory, e.g. experiments/run0.")
+    parser.add_argument("--group-by", type=str, nargs="+", default=["planner", "stage"],
+                        help="Trace fields used to group the calls.")
+    args = parser.parse_args()
+
+    trace_file = os.path.join(args.run_dir, "llm_trace.jsonl")
+    summary = summarize_records(load_trace(trace_file), args.group_by)
+
+    output_file_path = os.path.join(args.run_dir, "llm_trace_summary.json")
+    with open(output_file_path, 'w') as output_file:
+        json.dump(summary, output_file, indent=4)
+
+    for row in summary:
+        print(row)
+    print(f"[info] LLM trace summary written to {output_file_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,6 @@
 import argparse
-from juliacall import Main as jl
 from plan_evaluator import PlanEvaluator
 
-# Initialize Julia and load PDDL package
-jl.seval('using PDDL, SymbolicPlanners')
 
 def main():
     parser = argparse.ArgumentParser()
@@ -1,4 +1,3 @@
-import openai
 import os
 import subprocess
 
@@ -10,6 +9,4 @@ def load_openai_key():
     with open(openai_keys_file, "r") as f:
         context = f.read()
     openai_api_key = context.strip().split('\n')[0]
-    return openai_api_key
-
-openai_client = openai.OpenAI(api_key=load_openai_key())
\ No newline at end of file
+    return openai_api_key
\ No newline at end of file